@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, vim: expandtab:ts=4 -*-
+
+"""
+Benchmarks of emPhon on synthetic corpora generated from the test input.
+
+Measures the throughput (tokens/sec and sentences/sec) of Transcriber.__call__, Transcriber.segment,
+EmPhon.process_sentence (also on a pathological long sentence, in the default and the streaming mode) and the
+end-to-end command line tools for each of the four presets (ipa/noipa x comments/nocomments) and the peak memory
+usage of each measurement.
+The corpus is sampled from the few sentences of the test input, so with the transcriber cache almost every word is a
+cache hit: the benchmarks run without the cache, `--cache` adds the same benchmarks with the cache (marked `cached`).
+The results are saved as JSON and can be compared to an earlier run to detect regressions.
+
+Usage: python benchmarks/bench_emphon.py --sentences 2000 --output results.json --compare old_results.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tracemalloc
+import subprocess
+from tempfile import NamedTemporaryFile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from emphon import EmPhon, __version__  # noqa: E402
+from emphon.transcriber import Transcriber, _segment_anas  # noqa: E402
+
+TEST_INPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'inputs', 'telex_morph.in')
+
+PRESETS = {'ipa-comments': {'ipaize': True, 'include_sentence': True},
+           'ipa-nocomments': {'ipaize': True, 'include_sentence': False},
+           'noipa-comments': {'ipaize': False, 'include_sentence': True},
+           'noipa-nocomments': {'ipaize': False, 'include_sentence': False}}
+
+# The suffix of the names of the benchmarks with the transcriber cache
+CACHED_SUFFIX = ' (cached)'
+
+# Smaller changes of the peak memory usage are not reported as regression (e.g. the tiny peaks of the transcriber)
+MEMORY_NOISE = 1 << 20
+
+# Runs a module as the main program and reports the peak memory usage (maxrss in KiB on Linux) to stderr
+CHILD = ('import atexit, resource, runpy, sys\n'
+         'atexit.register(lambda: sys.stderr.write("MAXRSS %d\\n" % '
+         'resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))\n'
+         'module = sys.argv.pop(1)\n'
+         'runpy.run_module(module, run_name="__main__", alter_sys=True)\n')
+
+
+def read_corpus(path):
+    with open(path, encoding='UTF-8') as infile:
+        header = infile.readline().rstrip('\n').split('\t')
+        sentences, sentence = [], []
+        for line in infile:
+            line = line.rstrip('\n')
+            if len(line) == 0:
+                if len(sentence) > 0:
+                    sentences.append(sentence)
+                sentence = []
+            else:
+                sentence.append(line.split('\t'))
+        if len(sentence) > 0:
+            sentences.append(sentence)
+    return header, sentences
+
+
+def synthetic_corpus(sentences, size, seed):
+    """
+    Samples `size` sentences (with replacement) from the sentences of the test input
+    """
+    rand = random.Random(seed)
+    return [[list(token) for token in rand.choice(sentences)] for _ in range(size)]
+
+
+def long_sentence(sentences, size, seed):
+    """
+    Builds a pathological sentence of `size` tokens (like a table, a list or unsegmented web text) from the tokens of
+    the test input
+    """
+    rand = random.Random(seed)
+    tokens = [token for sentence in sentences for token in sentence]
+    return [list(rand.choice(tokens)) for _ in range(size)]
+
+
+def measure(func, repeat):
+    """
+    Runs `func` `repeat` times and returns the best wall time, then runs it once more under tracemalloc for the peak
+    memory usage, as tracing slows down the execution
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return best, peak
+
+
+def bench_library(header, corpus, preset, opts, cache):
+    """
+    Measures the transcriber and EmPhon.process_sentence on the corpus (and the segmentation without the cache, as it
+    does not use it)
+    """
+    field_names = {field: i for i, field in enumerate(header)}
+    tokens = sum(len(sentence) for sentence in corpus)
+    segmented = Transcriber.segment([token for sentence in corpus for token in sentence], field_names)
+
+    def new_transcriber():
+        return Transcriber(ipaize=opts['ipaize'], cache=cache)
+
+    def call():
+        transcriber = new_transcriber()
+        for word in segmented:
+            transcriber(word)
+
+    def segment():
+        _segment_anas.cache_clear()
+        for sentence in corpus:
+            Transcriber.segment(sentence, field_names)
+
+    def process_sentence():
+        _segment_anas.cache_clear()
+        emphon = EmPhon({'form', 'anas'}, ['phon'], {'ipaize': opts['ipaize'], 'cache': cache},
+                        include_sentence=opts['include_sentence'])
+        for sentence in corpus:
+            emphon.process_sentence([list(token) for token in sentence], field_names)
+
+    benchmarks = [('Transcriber.__call__', call), ('Transcriber.segment', segment),
+                  ('EmPhon.process_sentence', process_sentence)]
+    if cache:
+        benchmarks = [(name + CACHED_SUFFIX, func) for name, func in benchmarks if func is not segment]
+
+    results = []
+    for name, func in benchmarks:
+        seconds, peak = measure(func, opts['repeat'])
+        results.append({'benchmark': name, 'preset': preset, 'seconds': seconds,
+                        'tokens_per_sec': tokens / seconds, 'sentences_per_sec': len(corpus) / seconds,
+                        'peak_memory_bytes': peak})
+    return results
+
+
+def bench_long_sentence(header, sentence, preset, opts, cache):
+    """
+    Measures EmPhon.process_sentence on one very long sentence in the default (batch) and in the streaming mode,
+    mainly for the peak memory usage
+    """
+    field_names = {field: i for i, field in enumerate(header)}
+
+    def process_sentence(streaming):
+        def run():
+            emphon = EmPhon({'form', 'anas'}, ['phon'], {'ipaize': opts['ipaize'], 'cache': cache},
+                            include_sentence=opts['include_sentence'], streaming=streaming)
+            for _ in emphon.process_sentence(sentence, field_names):
+                pass
+            for token in sentence:  # Restore the input for the next run without copying it
+                del token[len(header):]
+        return run
+
+    results = []
+    for name, streaming in (('EmPhon long sentence', False), ('EmPhon long sentence (str.)', True)):
+        seconds, peak = measure(process_sentence(streaming), opts['repeat'])
+        results.append({'benchmark': name + (CACHED_SUFFIX if cache else ''), 'preset': preset, 'seconds': seconds,
+                        'tokens_per_sec': len(sentence) / seconds, 'sentences_per_sec': 1 / seconds,
+                        'peak_memory_bytes': peak})
+    return results
+
+
+def bench_cli(corpus_path, tokens, sentences, preset, opts, cache):
+    flags = ['--ipaize' if opts['ipaize'] else '--no-ipaize',
+             '--include-sentence' if opts['include_sentence'] else '--no-include-sentence',
+             '--cache' if cache else '--no-cache', '-i', corpus_path]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.join(os.path.dirname(TEST_INPUT), '..', '..')] +
+                                                      os.environ.get('PYTHONPATH', '').split(os.pathsep)))
+    results = []
+    for name, module, extra_flags in (('cli (xtsv)', 'emphon', []),
+                                      ('cli (emphon --stream-reader)', 'emphon', ['--stream-reader']),
+                                      ('cli (emphon.stream)', 'emphon.stream', [])):
+        best, maxrss = float('inf'), 0
+        for _ in range(opts['repeat']):
+            start = time.perf_counter()
+            proc = subprocess.run([sys.executable, '-c', CHILD, module] + flags + extra_flags, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+            elapsed = time.perf_counter() - start
+            if proc.returncode != 0:
+                errors = [line for line in proc.stderr.splitlines() if not line.startswith('MAXRSS ')]
+                print('Skipping {0}: {1}'.format(name, errors[-1] if errors else proc.returncode), file=sys.stderr)
+                break
+            best = min(best, elapsed)
+            maxrss = max(maxrss, int(proc.stderr.rsplit('MAXRSS ', 1)[1]))
+        else:
+            results.append({'benchmark': name + (CACHED_SUFFIX if cache else ''), 'preset': preset, 'seconds': best,
+                            'tokens_per_sec': tokens / best, 'sentences_per_sec': sentences / best,
+                            'peak_memory_bytes': maxrss * 1024})
+    return results
+
+
+def compare(results, old_results, threshold):
+    """
+    Prints the change of throughput and peak memory usage compared to an earlier run and returns whether any
+    benchmark slowed down or used more memory more than the threshold
+    """
+    old = {(res['benchmark'], res['preset']): res for res in old_results['results']}
+    regression = False
+    for res in results:
+        prev = old.get((res['benchmark'], res['preset']))
+        if prev is None:
+            continue
+        change = res['tokens_per_sec'] / prev['tokens_per_sec'] - 1
+        memory_change = res['peak_memory_bytes'] / max(prev['peak_memory_bytes'], 1) - 1
+        mark = ''
+        if change < -threshold:
+            mark = '  REGRESSION'
+            regression = True
+        if memory_change > threshold and res['peak_memory_bytes'] - prev['peak_memory_bytes'] > MEMORY_NOISE:
+            mark += '  MEMORY REGRESSION'
+            regression = True
+        print('{0:<40} {1:<17} {2:+8.1%} {3:+8.1%} (memory){4}'.format(res['benchmark'], res['preset'], change,
+                                                                      memory_change, mark))
+    return regression
+
+
+def main():
+    argparser = argparse.ArgumentParser(description='Benchmarks of emPhon on synthetic corpora')
+    argparser.add_argument('--input', default=TEST_INPUT, help='The emtsv file the corpus is sampled from')
+    argparser.add_argument('--sentences', type=int, default=1000, help='The number of sentences of the corpus')
+    argparser.add_argument('--repeat', type=int, default=3, help='The number of runs, the best one is reported')
+    argparser.add_argument('--seed', type=int, default=42, help='The seed of the sampling of the corpus')
+    argparser.add_argument('--presets', nargs='+', choices=sorted(PRESETS), default=sorted(PRESETS))
+    argparser.add_argument('--cache', dest='cache', action='store_true',
+                           help='Also run the benchmarks with the transcriber cache (mostly cache hits on the corpus)')
+    argparser.add_argument('--no-cli', dest='cli', action='store_false', help='Skip the end-to-end benchmarks')
+    argparser.add_argument('--long-tokens', type=int, default=20000,
+                           help='The number of tokens of the pathological long sentence, 0 skips it. Default: 20000')
+    argparser.add_argument('--output', help='Save the results as JSON to this file')
+    argparser.add_argument('--compare', help='Compare the results to an earlier JSON result file')
+    argparser.add_argument('--threshold', type=float, default=0.1,
+                           help='The relative slowdown reported as regression. Default: 0.1')
+    args = argparser.parse_args()
+
+    header, sentences = read_corpus(args.input)
+    corpus = synthetic_corpus(sentences, args.sentences, args.seed)
+    tokens = sum(len(sentence) for sentence in corpus)
+    long = long_sentence(sentences, args.long_tokens, args.seed)
+
+    with NamedTemporaryFile('w', encoding='UTF-8', suffix='.tsv', delete=False) as corpus_file:
+        corpus_file.write('\t'.join(header) + '\n')
+        corpus_file.writelines(''.join('\t'.join(token) + '\n' for token in sentence) + '\n' for sentence in corpus)
+
+    results = []
+    try:
+        for preset in args.presets:
+            opts = dict(PRESETS[preset], repeat=args.repeat)
+            for cache in (False, True) if args.cache else (False,):
+                results.extend(bench_library(header, corpus, preset, opts, cache))
+                if args.long_tokens > 0:
+                    results.extend(bench_long_sentence(header, long, preset, opts, cache))
+                if args.cli:
+                    results.extend(bench_cli(corpus_file.name, tokens, len(corpus), preset, opts, cache))
+    finally:
+        os.remove(corpus_file.name)
+
+    print('{0:<40} {1:<17} {2:>12} {3:>12} {4:>10}'.format('benchmark', 'preset', 'tokens/s', 'sentences/s',
+                                                          'peak MiB'))
+    for res in results:
+        print('{0:<40} {1:<17} {2:>12.0f} {3:>12.0f} {4:>10.1f}'.format(
+            res['benchmark'], res['preset'], res['tokens_per_sec'], res['sentences_per_sec'],
+            res['peak_memory_bytes'] / 2 ** 20))
+
+    output = {'version': __version__, 'python': platform.python_version(), 'machine': platform.machine(),
+              'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'sentences': len(corpus), 'tokens': tokens,
+              'cache': args.cache, 'results': results}
+
+    if args.output is not None:
+        with open(args.output, 'w', encoding='UTF-8') as outfile:
+            json.dump(output, outfile, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare, encoding='UTF-8') as infile:
+            if compare(results, json.load(infile), args.threshold):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,9 @@
-from .emphon import EmPhon
-from .version import __version__
+from time import perf_counter
 
-__all__ = ['EmPhon', __version__]
+_import_started = perf_counter()  # The start of the startup time reported by the command line tools
+
+from .emphon import EmPhon  # noqa: E402
+from .parallel import process_parallel  # noqa: E402
+from .version import __version__  # noqa: E402
+
+__all__ = ['EmPhon', 'process_parallel', __version__]
@@ -1,31 +1,44 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8, vim: expandtab:ts=4 -*-
 
-from xtsv import build_pipeline, parser_skeleton, jnius_config, add_bool_arg
+import sys
+from io import StringIO
+from time import perf_counter
+
+from emphon import EmPhon, _import_started
+from emphon.argparser import parser_skeleton, positive_int
+from emphon.bundle import format_startup_time
+from emphon.stream import add_emphon_args, emphon_kwargs_from_opts, process_stream
+from emphon.transcriber import format_rule_profile
 
 
 def main():
 
+    options_started = perf_counter()
     argparser = parser_skeleton(description='EmPhon - a phonetic transcriber module for xtsv')
 
-    add_bool_arg(argparser, 'ipaize',
-                 ('Whether the output should be IPA or the emPhon inner representation, '
-                  'which marks one phone with exactly one letter.'),
-                 default=True, has_negative_variant=True)
+    add_emphon_args(argparser)
+
+    argparser.add_argument('--workers', dest='workers', type=positive_int, default=1,
+                           help='The number of worker processes, more than one processes chunks of sentences in '
+                                'parallel (only the emphon tool). Default: 1')
+
+    argparser.add_argument('--chunk-size', dest='chunk_size', type=positive_int, default=1000,
+                           help='The number of sentences sent to a worker process at once. Default: 1000')
 
-    add_bool_arg(
-        argparser, 'opt-palatal-assim',
-        ('Whether optional palatal assimilation should happen with t/d+ny, e.g. lapátnyél -> lapátynyél'),
-        default=False, has_negative_variant=True)
+    argparser.add_argument('--stream-reader', dest='stream_reader', action='store_true',
+                           help='Read the input with the lightweight reader of emphon-stream instead of the xtsv '
+                                'pipeline, which does not import the framework (faster startup)')
 
-    add_bool_arg(
-        argparser, 'include-sentence',
-        'If on, there is a line of comment before the sentence that contains the entire surface form of the sentence.',
-        default=True, has_negative_variant=True)
+    argparser.add_argument('--startup-time', dest='startup_time', action='store_true',
+                           help='Print the time from the import of the package until the processing starts and the '
+                                'source of the rule patterns to STDERR')
 
     opts = argparser.parse_args()
 
-    jnius_config.classpath_show_warning = opts.verbose  # Suppress warning.
+    emphon_kwargs = emphon_kwargs_from_opts(argparser, opts)
+
+    startup = [('imports', options_started - _import_started), ('options', perf_counter() - options_started)]
 
     # Set input and output iterators...
     if opts.input_text is not None:
@@ -34,20 +47,85 @@ def main():
         input_data = opts.input_stream
     output_iterator = opts.output_stream
 
+    if opts.workers > 1:
+        # Run the emphon tool in a process pool with ordered output
+        from emphon.parallel import process_parallel
+        if isinstance(input_data, str):
+            input_data = StringIO(input_data)
+        if opts.startup_time:
+            sys.stderr.write(format_startup_time(startup))
+        rule_profile = process_parallel(input_data, output_iterator, emphon_kwargs, opts.workers, opts.chunk_size,
+                                        conllu_comments=opts.conllu_comments)
+        if opts.profile_rules:
+            sys.stderr.write(format_rule_profile(rule_profile))
+        return
+
+    if opts.stream_reader:
+        # Without importing the framework
+        if isinstance(input_data, str):
+            input_data = StringIO(input_data)
+        init_started = perf_counter()
+        emphon_instance = EmPhon(**emphon_kwargs)
+        startup.append(('EmPhon', perf_counter() - init_started))
+        if opts.startup_time:
+            sys.stderr.write(format_startup_time(startup))
+        process_stream(input_data, output_iterator, conllu_comments=opts.conllu_comments, emphon=emphon_instance)
+        if opts.profile_rules:
+            sys.stderr.write(format_rule_profile(emphon_instance.transcriber.rule_profile()))
+        return
+
+    xtsv_started = perf_counter()
+    from xtsv import build_pipeline, jnius_config, process
+    startup.append(('xtsv', perf_counter() - xtsv_started))
+
+    jnius_config.classpath_show_warning = opts.verbose  # Suppress warning.
+
+    if opts.profile_rules:
+        # Run the tool directly (not through the pipeline) to access the statistics of its instance afterwards
+        init_started = perf_counter()
+        emphon_instance = EmPhon(**emphon_kwargs)
+        startup.append(('EmPhon', perf_counter() - init_started))
+        if opts.startup_time:
+            sys.stderr.write(format_startup_time(startup))
+        output_iterator.writelines(process(input_data, emphon_instance, opts.conllu_comments))
+        sys.stderr.write(format_rule_profile(emphon_instance.transcriber.rule_profile()))
+        return
+
     # Set the tagger name as in the tools dictionary
     used_tools = ['emphon']
     presets = []
 
-    # Init and run the module as it were in xtsv
+    # Init and run the module as it were in xtsv (the tool is initialised when the pipeline is built)
+    init_started = perf_counter()
+    pipeline = build_pipeline(input_data, used_tools, _xtsv_tools(emphon_kwargs), presets, opts.conllu_comments)
+    startup.append(('EmPhon', perf_counter() - init_started))
+    if opts.startup_time:
+        sys.stderr.write(format_startup_time(startup))
+
+    # Run the pipeline on input and write result to the output...
+    output_iterator.writelines(pipeline)
+
+    # TODO this method is recommended when debugging the tool
+    # Alternative: Run specific tool for input (still in emtsv format):
+    # from xtsv import process
+    # from emphon import EmPhon
+    # output_iterator.writelines(process(input_data, EmPhon(**emphon_kwargs)))
+
+    # Alternative2: Run REST API debug server
+    # from xtsv import pipeline_rest_api, singleton_store_factory
+    # app = pipeline_rest_api('TEST', _xtsv_tools(emphon_kwargs), {},  conll_comments=False,
+    #                         singleton_store=singleton_store_factory(), form_title='TEST TITLE',
+    #                         doc_link='https://github.com/dlt-rilmta/emdummy')
+    # app.run()
 
-    emphon = ('emphon', 'EmPhon', 'EmPhon', (),
-                        {'source_fields': {'form', 'anas'},
-                         'target_fields': ['phon'],
-                         'include_sentence': opts.include_sentence,
-                         'transcriber_opts': {'ipaize': opts.ipaize,
-                                              'optional_palatal_assimilation': opts.opt_palatal_assim},
-                         },
-              )
+
+def _xtsv_tools(emphon_kwargs: dict, presets: bool = False) -> list:
+    """
+    :param emphon_kwargs: the keyword arguments of the emphon tool
+    :param presets: whether the preset tools (with fixed options) are listed instead of the emphon tool
+    :return: the tools in the format of the xtsv pipeline
+    """
+    emphon = ('emphon', 'EmPhon', 'EmPhon', (), emphon_kwargs)
 
     emphon_ipa_comments = ('emphon', 'EmPhon', 'emPhon phonetic transcriber with IPAization and with comment lines', (),
                            {'source_fields': {'form', 'anas'},
@@ -78,28 +156,25 @@ def main():
          'target_fields': ['phon'],
          'include_sentence': False, 'transcriber_opts': {'ipaize': False, 'optional_palatal_assimilation': False}, },)
 
-    tools = [(emphon, ('emphon', 'emPhon phonetic transcriber ', 'emPhon'))]
+    emphon_inner_ipa_comments = (
+        'emphon', 'EmPhon',
+        'emPhon phonetic transcriber with both the inner representation and IPA, with comment lines', (),
+        {'source_fields': {'form', 'anas'},
+         'target_fields': ['phon_inner', 'phon'],
+         'outputs': ['inner', 'ipa'],
+         'include_sentence': True, 'transcriber_opts': {'optional_palatal_assimilation': False}, },)
 
-    available_tools = [
+    if not presets:
+        return [(emphon, ('emphon', 'emPhon phonetic transcriber ', 'emPhon'))]
+
+    return [
         (emphon_ipa_comments, ('emphon-ipa-comments', 'emPhon-ipa-comments', 'emPhon-IPA-comments')),
         (emphon_ipa_nocomments, ('emphon-ipa-nocomments', 'emPhon-ipa-nocomments', 'emPhon-IPA-nocomments')),
         (emphon_noipa_comments, ('emphon-noipa-comments', 'emPhon-noipa-comments', 'emPhon-noIPA-comments')),
-        (emphon_noipa_nocomments, ('emphon-noipa-nocomments', 'emPhon-noipa-nocomments', 'emPhon-noIPA-nocomments'))]
-
-    # Run the pipeline on input and write result to the output...
-    output_iterator.writelines(build_pipeline(input_data, used_tools, tools, presets, opts.conllu_comments))
-
-    # TODO this method is recommended when debugging the tool
-    # Alternative: Run specific tool for input (still in emtsv format):
-    # from xtsv import process
-    # from emphon import EmPhon
-    # output_iterator.writelines(process(input_data, EmPhon(*emphon[3], **emphon[4])))
-
-    # Alternative2: Run REST API debug server
-    # from xtsv import pipeline_rest_api, singleton_store_factory
-    # app = pipeline_rest_api('TEST', tools, {},  conll_comments=False, singleton_store=singleton_store_factory(),
-    #                         form_title='TEST TITLE', doc_link='https://github.com/dlt-rilmta/emdummy')
-    # app.run()
+        (emphon_noipa_nocomments, ('emphon-noipa-nocomments', 'emPhon-noipa-nocomments',
+                                   'emPhon-noIPA-nocomments')),
+        (emphon_inner_ipa_comments, ('emphon-inner-ipa-comments', 'emPhon-inner-ipa-comments',
+                                     'emPhon-inner-IPA-comments'))]
 
 
 if __name__ == '__main__':
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, vim: expandtab:ts=4 -*-
+
+"""
+The command line helpers of xtsv (`xtsv.parser_skeleton` and `xtsv.add_bool_arg`) with the same options and help,
+without importing the framework (and Flask), so the tools which do not run the xtsv pipeline start fast.
+"""
+
+import sys
+from argparse import ArgumentParser, ArgumentTypeError, FileType
+
+
+def parser_skeleton(*args, **kwargs) -> ArgumentParser:
+    """
+    :return: a parser with the common options of the xtsv modules (as `xtsv.parser_skeleton`)
+    """
+    parser = ArgumentParser(*args, **kwargs)
+    input_group = parser.add_mutually_exclusive_group()
+    input_group.add_argument('-i', '--input', dest='input_stream', type=FileType(), default=sys.stdin,
+                             help='Use input file instead of --text or STDIN '
+                                  '(only allowed when at least one task is specified!)', metavar='FILE')
+    input_group.add_argument('-t', '--text', dest='input_text', type=str, default=None,
+                             help='Use input text instead of file or STDIN '
+                                  '(only allowed when at least one task is specified!)', metavar='TEXT')
+    parser.add_argument('-o', '--output', dest='output_stream', type=FileType('w'), default=sys.stdout,
+                        help='Use output file instead of STDOUT (only allowed when at least one task is specified!)',
+                        metavar='FILE')
+
+    add_bool_arg(parser, 'verbose', 'Show warnings')
+    add_bool_arg(parser, 'conllu-comments', 'Enable CoNLL-U style comments (lines starting with "# ")')
+    add_bool_arg(parser, 'output-header', 'Disable header for output')
+
+    parser.add_argument(dest='task', nargs='?', default=())
+
+    return parser
+
+
+def add_bool_arg(parser, name, help_text, default=False, has_negative_variant=True):
+    """
+    Adds an on/off switch (--name) to the parser, and its negative variant (--no-name) as xtsv does
+    """
+    dest = name.replace('-', '_')
+    group = parser
+    if has_negative_variant:
+        group = parser.add_mutually_exclusive_group(required=False)
+        group.add_argument('--no-' + name, dest=dest, help='{0} (negative variant)'.format(help_text),
+                           action='store_false')
+    group.add_argument('--' + name, dest=dest, help=help_text, action='store_true')
+    parser.set_defaults(**{dest: default})
+
+
+def positive_int(value: str) -> int:
+    """
+    The type of the options which must be a positive integer (a usage error instead of a traceback for the others)
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise ArgumentTypeError('{0!r} is not a positive integer'.format(value))
+    return number
+
+
+def non_negative_int(value: str) -> int:
+    """
+    The type of the options which must be a non-negative integer
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        number = -1
+    if number < 0:
+        raise ArgumentTypeError('{0!r} is not a non-negative integer'.format(value))
+    return number
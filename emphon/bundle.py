@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, vim: expandtab:ts=4 -*-
+
+"""
+Prebuilt bundle of the compiled rule patterns and the IPA key to speed up the startup of short jobs.
+
+`re` parses and compiles every rule pattern in each new process. The bundle keeps the compiled form of the patterns
+(the code of the regular expression engine), from which they are rebuilt without parsing and compiling, and the
+parsed IPA key. The code and `_sre.compile`, which rebuilds the patterns, are internals of CPython, so a bundle is
+tied to the exact interpreter which built it and the patterns are looked up by their source: a missing, stale or
+foreign bundle, or an interpreter without these internals only means that the patterns are compiled as usual.
+It is built by `emphon-bundle` (see `emphon.bundle_builder`) once after the installation.
+"""
+
+import os
+import re
+import sys
+import json
+import zlib
+import marshal
+from array import array
+from time import perf_counter
+
+try:
+    import _sre
+except ImportError:  # Not CPython
+    _sre = None
+
+BUNDLE_FORMAT = 1
+# The private interface of `re` used by the bundle, without it (or on another implementation) the bundle is ignored
+SUPPORTED = (sys.implementation.name == 'cpython' and callable(getattr(_sre, 'compile', None)) and
+             isinstance(getattr(_sre, 'MAGIC', None), int) and getattr(_sre, 'CODESIZE', None) in {2, 4})
+_CODE_TYPE = 'I' if SUPPORTED and _sre.CODESIZE == 4 else 'H'  # The code is stored as bytes (faster to load than ints)
+# The default location of the bundle (next to the package), the EMPHON_BUNDLE environment variable overrides it
+DEFAULT_BUNDLE_PATH = os.path.join(os.path.dirname(__file__), 'rules.bundle')
+IPA_KEY_PATH = os.path.join(os.path.dirname(__file__), 'ipa_key.json')
+
+_bundle = None  # (patterns, IPA key entry) of the loaded bundle, None until the first use
+_requested = []  # (pattern, flags) of every pattern compiled through `compile_pattern`, the contents of a new bundle
+_ipa_key = None
+_stats = {'path': None, 'loaded': 0, 'compiled': 0, 'seconds': 0.0}
+
+
+def bundle_path() -> str:
+    """
+    :return: the path of the bundle (an empty EMPHON_BUNDLE environment variable turns the bundle off)
+    """
+    return os.environ.get('EMPHON_BUNDLE', DEFAULT_BUNDLE_PATH)
+
+
+def _interpreter_tag() -> tuple:
+    if not SUPPORTED:
+        return None
+    return sys.implementation.name, sys.implementation.cache_tag, sys.version, _sre.MAGIC, _sre.CODESIZE
+
+
+def _load() -> tuple:
+    global _bundle
+    _bundle = {}, None
+    path = bundle_path()
+    if not path or not SUPPORTED:
+        return _bundle
+    try:
+        with open(path, 'rb') as infile:
+            bundle_format, interpreter_tag, patterns, ipa_key = marshal.load(infile)
+    except (OSError, EOFError, ValueError, TypeError):
+        return _bundle
+    if bundle_format == BUNDLE_FORMAT and interpreter_tag == _interpreter_tag() and isinstance(patterns, dict):
+        _bundle = patterns, ipa_key
+        _stats['path'] = path
+    return _bundle
+
+
+def compile_pattern(pattern: str, flags: int = 0):
+    """
+    Compiles a rule pattern as `re.compile` does, or rebuilds it from the bundle if it contains the pattern
+    :param pattern: the source of the regular expression
+    :param flags: the flags of `re`
+    :return: the compiled pattern
+    """
+    start = perf_counter()
+    _requested.append((pattern, flags))
+    patterns = (_bundle if _bundle is not None else _load())[0]
+    compiled = None
+    args = patterns.get((pattern, flags))
+    if args is not None:
+        try:
+            compiled = _rebuild(pattern, args)
+            _stats['loaded'] += 1
+        except (TypeError, ValueError, RuntimeError, AttributeError):  # Should not happen with the same interpreter
+            compiled = None
+    if compiled is None:
+        compiled = re.compile(pattern, flags)
+        _stats['compiled'] += 1
+    _stats['seconds'] += perf_counter() - start
+    return compiled
+
+
+def load_ipa_key() -> dict:
+    """
+    :return: the IPA key (inner representation -> IPA), from the bundle if it was built from the current key file
+    """
+    global _ipa_key
+    if _ipa_key is None:
+        with open(IPA_KEY_PATH, 'rb') as infile:
+            raw = infile.read()
+        ipa_key = (_bundle if _bundle is not None else _load())[1]
+        if ipa_key is not None and ipa_key[:2] == (len(raw), zlib.crc32(raw)):
+            _ipa_key = ipa_key[2]
+        else:
+            _ipa_key = json.loads(raw.decode('UTF-8'))
+    return dict(_ipa_key)
+
+
+def bundle_stats() -> dict:
+    """
+    :return: the path of the loaded bundle (None if there was no usable bundle), the number of the patterns rebuilt
+     from the bundle and compiled, and the time spent on them in seconds
+    """
+    return dict(_stats)
+
+
+def format_startup_time(phases) -> str:
+    """
+    :param phases: the (name, seconds) pairs of the phases of the startup
+    :return: the report of the startup time and the source of the rule patterns (e.g. for STDERR)
+    """
+    stats = bundle_stats()
+    template = 'Startup time: {0:.1f} ms ({1}), rule patterns: {2} from the bundle ({3}), {4} compiled, {5:.1f} ms\n'
+    return template.format(
+        sum(seconds for _, seconds in phases) * 1000,
+        ', '.join('{0}: {1:.1f} ms'.format(name, seconds * 1000) for name, seconds in phases),
+        stats['loaded'], stats['path'] or 'not found', stats['compiled'], stats['seconds'] * 1000)
+
+
+def _rebuild(pattern: str, args: tuple):
+    flags, code, groups, groupindex, indexgroup = args
+    return _sre.compile(pattern, flags, array(_CODE_TYPE, code).tolist(), groups, groupindex, indexgroup)
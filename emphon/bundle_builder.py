@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, vim: expandtab:ts=4 -*-
+
+"""
+Builder of the bundle of the compiled rule patterns and the IPA key (see `emphon.bundle`).
+
+The package does not import this module, so `python -m emphon.bundle_builder` runs it only once, as the main program,
+and the patterns compiled by the transcriber are registered in the `emphon.bundle` module imported by the package.
+
+Usage: emphon-bundle -o rules.bundle
+"""
+
+import os
+import re
+import sys
+import json
+import zlib
+import marshal
+import argparse
+from array import array
+
+try:
+    from re import _compiler as _sre_compile, _parser as _sre_parse
+except ImportError:  # Python < 3.11
+    try:
+        import sre_compile as _sre_compile
+        import sre_parse as _sre_parse
+    except ImportError:
+        _sre_compile = _sre_parse = None
+
+from emphon.bundle import BUNDLE_FORMAT, IPA_KEY_PATH, SUPPORTED, _CODE_TYPE, _interpreter_tag, _rebuild, _requested, \
+    bundle_path
+
+
+def _compiled_args(pattern: str, flags: int) -> tuple:
+    # The arguments of `_sre.compile` after the pattern, as `re` computes them
+    parsed = _sre_parse.parse(pattern, flags)
+    state = getattr(parsed, 'state', None) or parsed.pattern  # `pattern` before Python 3.8
+    code = array(_CODE_TYPE, _sre_compile._code(parsed, flags)).tobytes()
+    indexgroup = [None] * state.groups
+    for name, i in state.groupdict.items():
+        indexgroup[i] = name
+    return flags | state.flags, code, state.groups - 1, dict(state.groupdict), tuple(indexgroup)
+
+
+def build_bundle(path: str = None) -> int:
+    """
+    Writes the compiled form of the rule patterns and the IPA key to the bundle
+    :param path: the path of the bundle (default: `bundle_path()`)
+    :return: the number of patterns in the bundle
+    """
+    if path is None:
+        path = bundle_path()
+    if not path:
+        raise ValueError('The path of the bundle is empty!')
+    if not SUPPORTED or not hasattr(_sre_compile, '_code') or not hasattr(_sre_parse, 'parse'):
+        raise ValueError('The bundle is not supported by this Python interpreter ({0})!'.format(sys.version))
+
+    import emphon.transcriber  # noqa: F401 (its patterns are compiled through `compile_pattern` at import)
+
+    patterns = {}
+    for pattern, flags in _requested:
+        try:
+            args = _compiled_args(pattern, flags)
+            expected, rebuilt = re.compile(pattern, flags), _rebuild(pattern, args)
+        except (AttributeError, TypeError, ValueError, RuntimeError) as e:  # The internals of `re` have changed
+            raise ValueError('The pattern {0!r} could not be rebuilt: {1}'.format(pattern, e))
+        if (rebuilt.flags, rebuilt.groups, rebuilt.groupindex) != (expected.flags, expected.groups,
+                                                                   expected.groupindex):
+            raise ValueError('The pattern {0!r} could not be rebuilt!'.format(pattern))
+        patterns[(pattern, flags)] = args
+
+    with open(IPA_KEY_PATH, 'rb') as infile:
+        raw = infile.read()
+    ipa_key = (len(raw), zlib.crc32(raw), json.loads(raw.decode('UTF-8')))
+
+    # Written to a temporary file first, so a running process never reads a partial bundle
+    tmp_path = '{0}.tmp{1}'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as outfile:
+        marshal.dump((BUNDLE_FORMAT, _interpreter_tag(), patterns, ipa_key), outfile)
+    os.replace(tmp_path, path)
+    return len(patterns)
+
+
+def main():
+
+    argparser = argparse.ArgumentParser(
+        description='Build the bundle of the compiled rule patterns and the IPA key for the running Python version')
+    argparser.add_argument('-o', '--output', dest='output', default=None,
+                           help='The path of the bundle (default: $EMPHON_BUNDLE or rules.bundle in the package)')
+    opts = argparser.parse_args()
+
+    path = opts.output if opts.output is not None else bundle_path()
+    try:
+        count = build_bundle(path)
+    except ValueError as e:
+        argparser.error(str(e))
+    print('{0} patterns written to {1}'.format(count, path), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
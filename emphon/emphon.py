@@ -1,11 +1,29 @@
-from typing import List
+from typing import Iterator, List
+
+from emphon.lru import CacheInfo, LRUCache
 from emphon.transcriber import Transcriber
 
+OUTPUTS = {'inner', 'ipa'}
+# The default target field of each output form (e.g. for the command line)
+OUTPUT_FIELDS = {'inner': 'phon_inner', 'ipa': 'phon'}
+# The number of tokens transcribed in one batch by the streaming mode
+STREAM_CHUNK_SIZE = 256
+
 
 class EmPhon:
     def __init__(
             self, source_fields=None, target_fields=None, transcriber_opts: dict = None, strict_xtsv_format=False,
-            include_sentence=False):
+            include_sentence=False, outputs: List[str] = None, sentence_cache=False,
+            sentence_cache_size=4096, streaming=False):
+        """
+        :param outputs: the form of each target field (`inner` or `ipa`), all of them are derived from one run of the
+         rules. By default there is one target field and its form is set by the `ipaize` transcriber option
+        :param sentence_cache: whether the results of the sentences are memoized (keyed on the hash of their `form`
+         and `anas` fields) to reuse them for repeated sentences
+        :param sentence_cache_size: the maximal number of memoized sentences, the least recently used one is evicted
+        :param streaming: `process_sentence` returns a generator which processes the tokens in small chunks without
+         building the intermediate lists of the whole sentence (see `iter_sentence`), for very long sentences
+        """
 
         if source_fields is None:
             source_fields = set()
@@ -19,15 +37,48 @@ class EmPhon:
         self.source_fields = source_fields
         self.target_fields = target_fields
 
+        self.outputs = outputs
+        if outputs is None:
+            # The transcriber produces the only output as is and the comment line is named after the default field
+            self._converters = [None]
+            self._comment_names = ['phon']
+        else:
+            if len(outputs) != len(target_fields) or not set(outputs) <= OUTPUTS:
+                raise ValueError('outputs must contain one of {0} for each target field ({1}), got {2}!'.format(
+                    sorted(OUTPUTS), target_fields, outputs))
+            # IPA is only a final mapping step, so the rules produce the inner representation for all outputs
+            transcriber_opts = dict(transcriber_opts, ipaize=False)
+            self._comment_names = target_fields
+
         self.transcriber = Transcriber(**transcriber_opts)
 
+        if outputs is not None:
+            self._converters = [self.transcriber.ipaization if output == 'ipa' else None for output in outputs]
+
         self.include_sentence = include_sentence
+        self.streaming = streaming
+
+        self.sentence_cache = sentence_cache
+        if sentence_cache:
+            self._sentence_cache = LRUCache(sentence_cache_size)
 
     def comment_full_surface_form(self, segmented_sentence: List[str]) -> List[List[str]]:
 
-        full_sentence = self.transcriber(''.join(segmented_sentence))
+        # The sentences rarely recur, so they are not cached among the words
+        full_sentence = self.transcriber.transcribe(''.join(segmented_sentence))
+
+        return [['# {0} = {1}'.format(name, full_sentence if convert is None else convert(full_sentence))]
+                for name, convert in zip(self._comment_names, self._converters)]
 
-        return [['# phon = ' + full_sentence]]
+    def output_values(self, transcriptions: List[str]) -> List[tuple]:
+        """
+        :param transcriptions: the transcriptions of the segmented words by `self.transcriber`
+        :return: the values of the target fields for each word
+        """
+        if self.outputs is None:
+            return [(transcription,) for transcription in transcriptions]
+        return [tuple(transcription if convert is None else convert(transcription) for convert in self._converters)
+                for transcription in transcriptions]
 
     def process_sentence(self, sen, field_names=None):
         """
@@ -35,20 +86,168 @@ class EmPhon:
         :param sen: The list of all tokens in the sentence, each token contain all fields
         :param field_names: The prepared field_names from prepare_fields() to select the appropriate input field
          to process
-        :return: The sen object augmented with the output field values for each token
+        :return: The sen object augmented with the output field values for each token (an iterator over the comment
+         lines and the tokens in streaming mode)
         """
 
-        segmented_sentence = self.transcriber.segment(sentence=sen, field_names=field_names)
+        if self.streaming:
+            return self.iter_sentence(sen, field_names)
 
-        per_word_sentence = [self.transcriber(word) for word in segmented_sentence]
+        return self.process_sentences([sen], field_names)[0]
 
-        for line, transcription in zip(sen, per_word_sentence):
-            line.append(transcription)
+    def iter_sentence(self, sen, field_names=None) -> Iterator[List[str]]:
+        """
+        Processes one sentence token by token with bounded memory besides the sentence itself: the words are segmented
+        and transcribed in chunks of `STREAM_CHUNK_SIZE` tokens and their values are appended to the tokens in place.
+        Only the segmented words are kept for the comment lines. The output is the same as the output of
+        `process_sentence`.
+        :param sen: The list of all tokens in the sentence, each token contain all fields
+        :param field_names: The prepared field_names from prepare_fields() to select the appropriate input field
+         to process
+        :return: The comment lines (if they are included) and the tokens augmented with the output field values
+        """
+        key = None
+        if self.sentence_cache:
+            key = self._sentence_key(sen, field_names)
+            cached = self._sentence_cache.get(key)
+            if cached is not None:
+                per_token_values, comments = cached
+                for line, values in zip(sen, per_token_values):
+                    line.extend(values)
+                if self.include_sentence:
+                    yield from (list(comment) for comment in comments)
+                yield from sen
+                return
 
-        if self.include_sentence:
-            return self.comment_full_surface_form(segmented_sentence) + sen
+        # The values are only collected for the sentence cache
+        per_token_values = [] if key is not None else None
+        pieces = self._iter_transcribe_tokens(sen, field_names, per_token_values)
+        if not self.include_sentence:
+            for start, end, _ in pieces:  # The tokens are yielded as soon as their chunk is transcribed
+                yield from sen[start:end]
+            comments = []
         else:
-            return sen
+            comments = self.comment_full_surface_form([word for start, end, words in pieces for word in words])
+            yield from (list(comment) for comment in comments)
+            yield from sen
+
+        if key is not None:
+            self._sentence_cache.put(key, (per_token_values, comments))
+
+    def _iter_transcribe_tokens(self, sen, field_names, per_token_values: list = None):
+        """
+        Transcribes the tokens of the sentence in chunks and appends the output field values to them
+        :param per_token_values: if not None, the values of the tokens are also appended to it
+        :return: the start and the end of each chunk with the segmented words of its tokens
+        """
+        for start in range(0, len(sen), STREAM_CHUNK_SIZE):
+            end = min(start + STREAM_CHUNK_SIZE, len(sen))
+            chunk = sen[start:end]
+            words = list(self.transcriber.iter_segment(chunk, field_names))
+            transcriptions = self.transcriber.transcribe_batch(words)
+            for line, values in zip(chunk, self.output_values(transcriptions)):
+                line.extend(values)
+                if per_token_values is not None:
+                    per_token_values.append(values)
+            yield start, end, words
+
+    def process_sentences(self, sentences, field_names=None):
+        """
+        Process a chunk of sentences at once, the words of all sentences are transcribed in one batch
+        :param sentences: The list of sentences, each is the list of all tokens in the sentence
+        :param field_names: The prepared field_names from prepare_fields() to select the appropriate input field
+         to process
+        :return: The list of sentences augmented with the output field values for each token
+        """
+
+        results = [None] * len(sentences)
+        keys = None
+        repeats = []  # The later occurrences of the sentences which are transcribed in this chunk
+        if self.sentence_cache:
+            # Repeated sentences (bylines, banners, etc.) are neither segmented nor transcribed again, even within
+            # the chunk: each distinct sentence missing from the cache is transcribed once
+            keys = [self._sentence_key(sen, field_names) for sen in sentences]
+            todo, first = [], {}
+            for i, key in enumerate(keys):
+                if key in first:
+                    repeats.append((i, first[key]))
+                    continue
+                results[i] = self._sentence_cache.get(key)
+                if results[i] is None:
+                    first[key] = i
+                    todo.append(i)
+        else:
+            todo = range(len(sentences))
+
+        for i, result in zip(todo, self._transcribe_sentences([sentences[i] for i in todo], field_names)):
+            results[i] = result
+            if keys is not None:
+                self._sentence_cache.put(keys[i], result)
+
+        for i, first_i in repeats:
+            # Looked up as if the sentences were processed one by one (a hit, unless the chunk already evicted it)
+            results[i] = self._sentence_cache.get(keys[i]) or results[first_i]
+
+        output = []
+        for sen, (per_token_values, comments) in zip(sentences, results):
+            for line, values in zip(sen, per_token_values):
+                line.extend(values)
+
+            if self.include_sentence:
+                output.append([list(comment) for comment in comments] + sen)
+            else:
+                output.append(sen)
+
+        return output
+
+    def _transcribe_sentences(self, sentences, field_names):
+        """
+        :return: The output field values of each token and the comment lines for each sentence
+        """
+
+        segmented_sentences = [self.transcriber.segment(sentence=sen, field_names=field_names) for sen in sentences]
+
+        transcriptions = self.transcriber.transcribe_batch(
+            [word for segmented_sentence in segmented_sentences for word in segmented_sentence])
+
+        results = []
+        start = 0
+        for segmented_sentence in segmented_sentences:
+            per_word_sentence = transcriptions[start:start + len(segmented_sentence)]
+            start += len(segmented_sentence)
+
+            per_token_values = self.output_values(per_word_sentence)
+
+            if self.include_sentence:
+                comments = self.comment_full_surface_form(segmented_sentence)
+            else:
+                comments = []
+
+            results.append((per_token_values, comments))
+
+        return results
+
+    @staticmethod
+    def _sentence_key(sen, field_names) -> bytes:
+        from hashlib import blake2b  # Only needed by the sentence cache, not imported at startup
+        form, anas = field_names['form'], field_names['anas']
+        # Hashed line by line, without joining the fields of the whole sentence
+        digest = blake2b(digest_size=16)
+        separator = b''
+        for line in sen:
+            digest.update(separator)
+            digest.update((line[form] + '\t' + line[anas]).encode('UTF-8'))
+            separator = b'\n'
+        return digest.digest()
+
+    def sentence_cache_info(self) -> CacheInfo:
+        """
+        Statistics of the sentence cache in the style of `functools.lru_cache` (all zero if it is off)
+        :return: the number of hits, misses and evictions, the maximal and the current size of the cache
+        """
+        if not self.sentence_cache:
+            return CacheInfo(0, 0, 0, 0, 0)
+        return self._sentence_cache.info()
 
     @staticmethod
     def prepare_fields(field_names):
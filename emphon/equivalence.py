@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, vim: expandtab:ts=4 -*-
+
+"""
+Differential checker of the transcription engines of emPhon.
+
+Every optimised path of the transcriber (the skipped and merged rules, the cache, the batches, the lexicon, ...)
+must give exactly the output of the plain rule cascade. This module keeps the plain cascade as a reference, generates
+random and corpus-derived inputs over the inner alphabet, runs each engine and the reference side by side and reports
+the minimized inputs where they differ.
+
+Usage: python -m emphon.equivalence --cases 1000000 --workers 4 --corpus tests/inputs/telex_morph.in
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import importlib.util
+from collections import namedtuple
+from multiprocessing import Pool
+from typing import Callable, Iterator, List, Sequence, Tuple
+
+from emphon.argparser import non_negative_int, positive_int
+from emphon.transcriber import Transcriber
+
+# The reference keeps its own copy of the rules and tables of the original transcriber, so a change of the
+# transcriber (a rewritten pattern, a wrong table) can never change the reference too
+_X_LETTER = re.compile(r'[Xx]')
+_LONG_LETTERS = re.compile(r'([bcdfghjklmnpqrstvxzčďǧɲʃťž])\1')
+_DOUBLE_LETTERS = re.compile(r'(ccs|ddzs|ddz|ggy|lly|nny|ssz|tty|zzs|cs|dzs|dz|gy|ly|ny|sz|ty|zs)')
+_L_ASSIMILATION = re.compile(r'[lL][|§#~]?r')  # balra
+_H_FINAL_CH = re.compile(r'(ch$)')
+_H_INTERVOCALIC = re.compile(r'([aáeéiíoóöőüűuú][|§#~ ]?)h([|§#~ ]?[aáeéiíoóöőüűuú])')  # tehén
+_H_LONG_INTERVOCALIC = re.compile(r'([aáeéiíoóöőüűuú][|§#~ ]?)H([|§#~ ]?[aáeéiíoóöőüűuú])')  # ahhoz
+_H_CH = re.compile(r'([aáeéiíoóöőüűuú][|§#~]?)[c]h([|§#~]?[bcdfgjklmnpqrstvxzčďǧɲʃťž ]?)')  # pechből
+_H_AFTER_SONORANT = re.compile(r'([mnɲrlj][|§#~]?)h')
+_NASALISATION = re.compile(r'n([|~§#]?)([pbfvǧť])')  # tanpálya
+_NASALISATION_NY = re.compile(r'(n)([|~§#]?ɲ)')  # lennyakkendő
+_N_ASSIMILATION = re.compile(r'n[|~§]?([lr])')  # hasonló
+# The sibilant rules one by one, as they are written in the literature (the transcriber merges them)
+_SIBILANT_RULES = tuple((re.compile(pattern), repl) for pattern, repl in
+                        ((r'(t)([|~§#]?ʃ)', 'C'),  # hatszög
+                         (r'(t)([|~§#]?s)', 'Č'),  # hátság
+                         (r'(t)([|~§# ]?c)', 'C'),  # hét cica
+                         (r'(t)([|~§# ]?č)', 'Č'),  # hat csap
+                         (r'(d)([|~§#]?ʃ)', 'C'),  # rendszer
+                         (r'(d)([|~§#]?s)', 'Č')))  # hadsereg
+_VOICE_REGRESSIVE_DEVOICING = re.compile(r'([bdǧgzžďvĵ])([|~§#]?[ptťkʃscfhč])')  # útpadka -> útpatka
+_VOICE_REGRESSIVE_VOICING = re.compile(r'([ptťkʃscfhč])([|~§#]?[bdǧgzžďĵ])')  # habfürdő -> hapfürdő
+_PALATAL_FULL = re.compile(r'([ǧdlnɲtť])[|~§#]?j')  # hagyjál
+_PALATAL_PARTIAL = re.compile(r'[dt][|~§# ]?([ǧť])')  # hét tyúk
+_PALATAL_OPTIONAL = re.compile(r'([dt])[|~§# ]?ɲ')  # lapátnyél
+_HIATUS_I_VOWEL = re.compile(r'i[|~§]?([aáeéoóöőüűuú])')
+_HIATUS_VOWEL_I = re.compile(r'([aáeéoóöőüűuú])[|~§]?i')
+_N_NASALIZATION = re.compile(r'n[|~§#]?([gk])')
+_DEGEMINATION_LONG_SHORT = re.compile(
+    r'([BCDFGHJKLMNPQRSTVWXZČĎǦƝƩŤŽ])([|§~# ]?)([bcdfghjklmnpqrstvwxzčďǧɲʃťž])')  # Ludd tábornok
+_DEGEMINATION_SHORT_SHORT_SHORT = re.compile(
+    r'([bcdfghjklmnpqrstvwxzčďǧɲʃťž]([bcdfghjklmnpqrstvwxzčďǧɲʃťž]))[|#§~ ]?\2')  # Ford dísztárcsa
+_DEGEMINATION_SHORT_LONG = re.compile(
+    r'([bcdfghjklmnpqrstvwxzčďǧɲʃťž])[|~#§]?([BCDFGHJKLMNPQRSTVWXZČĎǦƝƩŤŽ])')
+_DEGEMINATION_CONS_CONS_OBSTRUENT = re.compile(
+    r'([bcdfghjklmnpqrstvwxzčďǧɲʃťž])[|~#§ ]?(\1[bcdfghkpqstvwxzčďǧʃťž])')
+_DEGEMINATION_LONG_OBSTRUENT = re.compile(r'([BCDFGHJKLMNPQRSTVWXZČĎǦƝƩŤŽ])([bcdfghkpqstvwxzčďǧʃťž])')
+_DEGEMINATION_CONS_CONS_NASAL = re.compile(r'([bcdfghjklmnpqrstvwxzčďǧɲʃťž])[|~#§ ]?(\1[mnɲ])')
+_DEGEMINATION_LONG_NASAL = re.compile(r'([BCDFGHJKLMNPQRSTVWXZČĎǦƝƩŤŽ])([mnɲ])')
+_M_NASALIZATION = re.compile(r'[mn][|#§~ ]?([fv])')  # kámfor
+_BOUNDARIES = re.compile(r'[|~§#]')
+
+_DOUBLE_LETTER_VOCAB = {'ccs': 'Č', 'ddzs': 'Ĵ', 'ddz': 'Ď', 'ggy': 'Ǧ', 'lly': 'J', 'nny': 'Ɲ', 'ssz': 'Ʃ',
+                        'tty': 'Ť', 'zzs': 'Ž', 'cs': 'č', 'dzs': 'ĵ', 'dz': 'ď', 'gy': 'ǧ', 'ly': 'j', 'ny': 'ɲ',
+                        'sz': 'ʃ', 'ty': 'ť', 'zs': 'ž'}
+_NASALISATION_PAIRS = {'p': 'm', 'b': 'm', 'f': 'm', 'v': 'm', 'ǧ': 'ɲ', 'ť': 'ɲ'}
+_VOICE_PAIRS = {'p': 'b', 'b': 'p', 't': 'd', 'd': 't', 'ť': 'ǧ', 'ǧ': 'ť', 'k': 'g', 'g': 'k', 'f': 'v', 'v': 'f',
+                'ʃ': 'z', 'z': 'ʃ', 's': 'ž', 'ž': 's', 'c': 'ď', 'ď': 'c', 'h': 'ɦ', 'č': 'ĵ', 'ĵ': 'č'}
+_PALATAL_FULL_DICT = {'ǧ': 'Ǧ', 'd': 'Ǧ', 'l': 'J', 'n': 'Ɲ', 'ɲ': 'Ɲ', 't': 'Ť', 'ť': 'Ť'}
+_PALATAL_OPTIONAL_DICT = {'d': 'ǧɲ', 't': 'ťɲ'}
+_IPA_KEY_PATH = os.path.join(os.path.dirname(__file__), 'ipa_key.json')
+
+_VOWEL_LETTERS = 'aáeéiíoóöőüűuú'
+_CONSONANT_LETTERS = 'bcdfghjklmnpqrstvwxyz'
+_LONG_CONSONANT_LETTERS = 'BCDFGHJKLMNPQRSTVWXZČĎǦƝƩŤŽ'
+_BOUNDARY_LETTERS = '|#§~'
+
+Counterexample = namedtuple('Counterexample', ['engine', 'ipaize', 'optional_palatal_assimilation', 'passes', 'case',
+                                               'minimized', 'expected', 'actual'])
+
+
+class ReferenceTranscriber:
+    """
+    The plain rule cascade: every rule runs on every input with all of its patterns one after the other and ends with
+    the normalisation of the doubled letters, without caches, skipped rules or any other shortcut.
+    """
+    def __init__(self, ipaize: bool = True, optional_palatal_assimilation: bool = False):
+        """
+        :param ipaize: whether the output uses the inner representation or the IPA form
+        :param optional_palatal_assimilation: optional palatal assimilation in cases like `lapátnyél`
+        """
+        self.ipaize = ipaize
+        self.optional_palatal_assimilation = optional_palatal_assimilation
+        if self.ipaize:
+            with open(_IPA_KEY_PATH, encoding='UTF-8') as infile:
+                self.ipa_key = json.load(infile)
+
+    def __call__(self, sentence: str, passes=2) -> str:
+        """
+        :param sentence: the sentence to process
+        :param passes: the number of passes sentence goes under
+        :return: the processed sentence
+        """
+        sentence = _X_LETTER.sub('ksz', sentence)
+        sentence = _double_letters(sentence)
+        sentence = _h_transformation(sentence)
+        sentence = _HIATUS_VOWEL_I.sub(r'\g<1>ji', _HIATUS_I_VOWEL.sub(r'ij\g<1>', sentence))
+
+        for _ in range(passes):
+            sentence = _double_letters(_N_NASALIZATION.sub(r'ŋ\g<1>', sentence))
+            sentence = _double_letters(_L_ASSIMILATION.sub('R', sentence))
+            sentence = _degemination(sentence)
+            sentence = _long_letters(_N_ASSIMILATION.sub(lambda m: m.group(1).upper(), sentence))
+            sentence = self._palatal_assimilation(sentence)
+            sentence = _long_letters(_M_NASALIZATION.sub(r'ɱ\g<1>', sentence))
+            for pattern, repl in _SIBILANT_RULES:
+                sentence = pattern.sub(repl, sentence)
+            sentence = _long_letters(sentence)
+            sentence = _VOICE_REGRESSIVE_DEVOICING.sub(lambda m: _VOICE_PAIRS[m.group(1)] + m.group(2), sentence)
+            sentence = _VOICE_REGRESSIVE_VOICING.sub(lambda m: _VOICE_PAIRS[m.group(1)] + m.group(2), sentence)
+            sentence = _long_letters(sentence)
+            sentence = _NASALISATION.sub(lambda m: _NASALISATION_PAIRS[m.group(2)] + m.group(1) + m.group(2), sentence)
+            sentence = _long_letters(_NASALISATION_NY.sub('Ɲ', sentence))
+
+        if self.ipaize:
+            sentence = _long_letters(_BOUNDARIES.sub('', sentence))
+            sentence = ''.join(self.ipa_key.get(letter, letter) for letter in sentence)
+        return sentence
+
+    def _palatal_assimilation(self, sentence: str) -> str:
+        sentence = _PALATAL_FULL.sub(lambda m: _PALATAL_FULL_DICT[m.group(1)], sentence)
+        sentence = _PALATAL_PARTIAL.sub(lambda m: m.group(1).upper(), sentence)
+        if self.optional_palatal_assimilation:
+            sentence = _PALATAL_OPTIONAL.sub(lambda m: _PALATAL_OPTIONAL_DICT[m.group(1)], sentence)
+        return _long_letters(sentence)
+
+
+def _long_letters(sentence: str) -> str:
+    return _LONG_LETTERS.sub(lambda m: m.group(1).upper(), sentence)
+
+
+def _double_letters(sentence: str) -> str:
+    return _long_letters(_DOUBLE_LETTERS.sub(lambda m: _DOUBLE_LETTER_VOCAB[m.group(1)], sentence))
+
+
+def _h_transformation(sentence: str) -> str:
+    sentence = _H_FINAL_CH.sub('Ḧ', sentence)
+    sentence = _H_INTERVOCALIC.sub(r'\g<1>ɦ\g<2>', sentence)
+    sentence = _H_LONG_INTERVOCALIC.sub(r'\g<1>Ḧ\g<2>', sentence)
+    sentence = _H_CH.sub(r'\g<1>ḧ\g<2>', sentence)
+    sentence = _H_AFTER_SONORANT.sub(r'\g<1>ɦ', sentence)
+    return _long_letters(sentence)
+
+
+def _degemination(sentence: str) -> str:
+    sentence = _DEGEMINATION_LONG_SHORT.sub(lambda m: m.group(1).lower() + m.group(2) + m.group(3), sentence)
+    sentence = _DEGEMINATION_SHORT_SHORT_SHORT.sub(r'\g<1>', sentence)
+    sentence = _DEGEMINATION_SHORT_LONG.sub(lambda m: m.group(1) + m.group(2).lower(), sentence)
+    sentence = _DEGEMINATION_CONS_CONS_OBSTRUENT.sub(r'\g<2>', sentence)
+    sentence = _DEGEMINATION_LONG_OBSTRUENT.sub(lambda m: m.group(1).lower() + m.group(2), sentence)
+    sentence = _DEGEMINATION_CONS_CONS_NASAL.sub(r'\g<2>', sentence)  # optional
+    sentence = _DEGEMINATION_LONG_NASAL.sub(lambda m: m.group(1).lower() + m.group(2), sentence)
+    return _long_letters(sentence)
+
+
+def _tokens() -> List[str]:
+    # The pieces of the random inputs with repetitions as weights: letters, digraphs, doubled letters and boundaries
+    vocab = _DOUBLE_LETTER_VOCAB
+    return list(_VOWEL_LETTERS * 3) + list(_CONSONANT_LETTERS * 2) + list(vocab) * 2 + \
+        [letter * 2 for letter in _CONSONANT_LETTERS] + list(_LONG_CONSONANT_LETTERS) + \
+        ['ch', 'hh', 'X', '.', '5'] + list(_BOUNDARY_LETTERS * 3)
+
+
+def random_cases(rnd: random.Random, count: int, max_tokens: int = 10, max_words: int = 4) -> Iterator[str]:
+    """
+    Generates random words and short sentences (the words end with a space as the segmented words do)
+    :param rnd: the random generator
+    :param count: the number of cases
+    :param max_tokens: the maximal number of pieces (letters, digraphs, boundaries) of a word
+    :param max_words: the maximal number of words of a case
+    :return: the cases
+    """
+    tokens = _tokens()
+    for _ in range(count):
+        words = [''.join(rnd.choices(tokens, k=rnd.randint(1, max_tokens))) for _ in range(rnd.randint(1, max_words))]
+        yield ' '.join(words) + rnd.choice(('', ' '))
+
+
+def corpus_cases(rnd: random.Random, words: Sequence[str], count: int, max_words: int = 4) -> Iterator[str]:
+    """
+    Generates cases from the segmented words of a corpus: the words themselves, their random sequences and mutants
+    (a random piece of the word is replaced by random letters, digraphs or boundaries)
+    :param rnd: the random generator
+    :param words: the segmented words of the corpus (see `Transcriber.segment`)
+    :param count: the number of cases
+    :param max_words: the maximal number of words of a case
+    :return: the cases
+    """
+    tokens = _tokens()
+    for _ in range(count):
+        kind = rnd.randrange(3)
+        if kind == 0:
+            yield rnd.choice(words)
+        elif kind == 1:
+            yield ''.join(rnd.choices(words, k=rnd.randint(2, max_words)))
+        else:
+            word = rnd.choice(words)
+            start = rnd.randrange(len(word))
+            end = min(len(word), start + rnd.randint(0, 3))
+            yield word[:start] + ''.join(rnd.choices(tokens, k=rnd.randint(1, 3))) + word[end:]
+
+
+def read_corpus_words(path: str) -> List[str]:
+    """
+    Reads the distinct segmented words of an emtsv corpus with form and anas fields
+    :param path: the corpus file
+    :return: the segmented words
+    """
+    from emphon.tsv import read_header, read_sentences
+
+    words = set()
+    with open(path, encoding='UTF-8') as infile:
+        _, field_names = read_header(infile, {'form', 'anas'})
+        for _, sentence in read_sentences(infile):
+            words.update(Transcriber.segment(sentence, field_names))
+    return sorted(words)
+
+
+# The engines get a chunk of cases and the options, and return the transcription of each case
+
+def _engine_transcribe(cases, ipaize, opt, passes):
+    transcriber = Transcriber(ipaize, opt, cache=False)
+    return [transcriber.transcribe(case, passes) for case in cases]
+
+
+def _engine_cache(cases, ipaize, opt, passes):
+    # A small cache and a warm-up in the reverse order, so that hits, misses and evictions all take part
+    transcriber = Transcriber(ipaize, opt, cache_size=256)
+    for case in reversed(cases):
+        transcriber(case, passes)
+    return [transcriber(case, passes) for case in cases]
+
+
+def _engine_batch(cases, ipaize, opt, passes):
+    return Transcriber(ipaize, opt, cache=False).transcribe_batch(list(cases), passes)
+
+
+def _engine_lexicon(cases, ipaize, opt, passes):
+    # Every second case is in the lexicon, the rest is transcribed by the rules
+    from emphon.lexicon import Lexicon, lexicon_fingerprint
+
+    entries = sorted(set(cases[::2]))
+    fd, path = tempfile.mkstemp(suffix='.lexicon')
+    os.close(fd)
+    try:
+        Lexicon.write(path, dict(zip(entries, Transcriber(ipaize, opt, cache=False).transcribe_batch(entries, passes))),
+                      lexicon_fingerprint(ipaize, opt, passes), passes)
+        transcriber = Transcriber(ipaize, opt, cache=False, lexicon=path)
+        return [transcriber(case, passes) for case in cases]
+    finally:
+        os.remove(path)
+
+
+def _engine_profile(cases, ipaize, opt, passes):
+    transcriber = Transcriber(ipaize, opt, cache=False, profile_rules=True)
+    return [transcriber(case, passes) for case in cases]
+
+
+def _engine_ipaization(cases, ipaize, opt, passes):
+    # The inner representation converted separately, as EmPhon does when it emits both outputs
+    transcriber = Transcriber(False, opt, cache=False)
+    if ipaize:
+        return [transcriber.ipaization(transcriber(case, passes)) for case in cases]
+    return [transcriber(case, passes) for case in cases]
+
+
+def _engine_vectorized(cases, ipaize, opt, passes):
+    return Transcriber(ipaize, opt, cache=False, vectorized=True).transcribe_batch(list(cases), passes)
+
+
+ENGINES = {'transcribe': _engine_transcribe,
+           'cache': _engine_cache,
+           'batch': _engine_batch,
+           'lexicon': _engine_lexicon,
+           'profile': _engine_profile,
+           'ipaization': _engine_ipaization}
+if importlib.util.find_spec('numpy') is not None:  # The vectorised engine is optional
+    ENGINES['vectorized'] = _engine_vectorized
+
+
+def _run_engine(engine: Callable, cases: List[str], ipaize: bool, opt: bool, passes: int) -> List[str]:
+    # A crash counts as a difference: the failing chunk is retried case by case to find the culprit
+    try:
+        return engine(cases, ipaize, opt, passes)
+    except Exception:
+        results = []
+        for case in cases:
+            try:
+                results.extend(engine([case], ipaize, opt, passes))
+            except Exception as e:
+                results.append('<{0}: {1}>'.format(type(e).__name__, e))
+        return results
+
+
+def minimize(case: str, fails: Callable[[str], bool]) -> str:
+    """
+    Shrinks a failing input: removes ever smaller pieces of it while it keeps failing (delta debugging)
+    :param case: the failing input
+    :param fails: decides whether an input still fails
+    :return: the shortest failing input found
+    """
+    size = max(len(case) // 2, 1)
+    while True:
+        removed = False
+        start = 0
+        while start < len(case):
+            candidate = case[:start] + case[start + size:]
+            if candidate and fails(candidate):
+                case = candidate
+                removed = True
+            else:
+                start += size
+        if not removed:
+            if size == 1:
+                return case
+            size = max(size // 2, 1)
+
+
+def check_cases(cases: List[str], engines: Sequence[str], ipaize: bool, opt: bool, passes: int = 2,
+                max_counterexamples: int = 10) -> List[Counterexample]:
+    """
+    Compares the engines to the reference cascade on the cases
+    :param cases: the inputs
+    :param engines: the names of the engines (see `ENGINES`)
+    :param ipaize: whether the output uses the inner representation or the IPA form
+    :param opt: optional palatal assimilation in cases like `lapátnyél`
+    :param passes: the number of passes of the transcription
+    :param max_counterexamples: the maximal number of reported differences per engine
+    :return: the differences with the minimized inputs
+    """
+    reference = ReferenceTranscriber(ipaize, opt)
+    expected = [reference(case, passes) for case in cases]
+    counterexamples = []
+    for name in engines:
+        engine = ENGINES[name]
+
+        def fails(candidate):
+            return _run_engine(engine, [candidate], ipaize, opt, passes)[0] != reference(candidate, passes)
+
+        found = 0
+        for case, expected_output, actual in zip(cases, expected, _run_engine(engine, cases, ipaize, opt, passes)):
+            if actual != expected_output:
+                # Some differences only show up together with the other cases (e.g. in a batch)
+                minimized = minimize(case, fails) if fails(case) else case
+                counterexamples.append(Counterexample(name, ipaize, opt, passes, case, minimized,
+                                                      reference(minimized, passes),
+                                                      _run_engine(engine, [minimized], ipaize, opt, passes)[0]))
+                found += 1
+                if found >= max_counterexamples:
+                    break
+    return counterexamples
+
+
+# The corpus words of the worker processes
+_corpus_words = ()
+
+
+def _init_worker(corpus_words):
+    global _corpus_words
+    _corpus_words = corpus_words
+
+
+def _check_chunk(args) -> Tuple[int, List[Counterexample]]:
+    seed, index, size, engines, passes, max_counterexamples = args
+    rnd = random.Random('{0}-{1}'.format(seed, index))
+    if _corpus_words and index % 2 == 1:
+        cases = list(corpus_cases(rnd, _corpus_words, size))
+    else:
+        cases = list(random_cases(rnd, size))
+    # The chunks take turns with the four combinations of the options
+    ipaize, opt = (True, False, True, False)[index % 4], (False, False, True, True)[index % 4]
+    return len(cases), check_cases(cases, engines, ipaize, opt, passes, max_counterexamples)
+
+
+def check(cases: int, engines: Sequence[str] = tuple(ENGINES), seed: int = 0, corpus_words: Sequence[str] = (),
+          passes: int = 2, workers: int = 1, chunk_size: int = 5000, max_counterexamples: int = 10) \
+        -> Tuple[int, List[Counterexample]]:
+    """
+    Runs the engines against the reference cascade on random (and corpus-derived) cases in chunks
+    :param cases: the number of cases
+    :param engines: the names of the engines (see `ENGINES`)
+    :param seed: the seed of the random inputs, the same seed gives the same inputs
+    :param corpus_words: segmented corpus words, half of the chunks are derived from them if given
+    :param passes: the number of passes of the transcription
+    :param workers: the number of worker processes
+    :param chunk_size: the number of cases in a chunk
+    :param max_counterexamples: the maximal number of reported differences (per chunk and engine)
+    :return: the number of checked cases and the differences
+    """
+    unknown = set(engines) - ENGINES.keys()
+    if unknown:
+        raise ValueError('Unknown engines: {0}, choose from {1}!'.format(sorted(unknown), sorted(ENGINES)))
+    if workers < 1 or chunk_size < 1:
+        raise ValueError('workers and chunk_size must be positive!')
+
+    tasks = [(seed, index, min(chunk_size, cases - start), tuple(engines), passes, max_counterexamples)
+             for index, start in enumerate(range(0, cases, chunk_size))]
+    checked, counterexamples = 0, []
+    if workers == 1:
+        _init_worker(tuple(corpus_words))
+        results = map(_check_chunk, tasks)
+    else:
+        pool = Pool(workers, initializer=_init_worker, initargs=(tuple(corpus_words),))
+        results = pool.imap_unordered(_check_chunk, tasks)
+    try:
+        for size, found in results:
+            checked += size
+            counterexamples.extend(found)
+    finally:
+        if workers > 1:
+            pool.close()
+            pool.join()
+    return checked, counterexamples
+
+
+def format_counterexample(counterexample: Counterexample) -> str:
+    """
+    :param counterexample: a difference found by `check`
+    :return: the readable report of the difference
+    """
+    return ('{0.engine} (ipaize={0.ipaize}, opt_palatal_assim={0.optional_palatal_assimilation}, '
+            'passes={0.passes})\n  input:     {0.case!r}\n  minimized: {0.minimized!r}\n'
+            '  expected:  {0.expected!r}\n  actual:    {0.actual!r}\n'.format(counterexample))
+
+
+def main():
+
+    argparser = argparse.ArgumentParser(description='Compares the optimised transcription engines of emPhon to the '
+                                                    'plain rule cascade on random and corpus-derived inputs')
+    argparser.add_argument('--cases', type=positive_int, default=100000, help='The number of cases. Default: 100000')
+    argparser.add_argument('--engines', nargs='+', default=list(ENGINES), choices=sorted(ENGINES),
+                           help='The engines to check. Default: all')
+    argparser.add_argument('--corpus', default=None,
+                           help='An emtsv corpus (form and anas fields), half of the cases are derived from its words')
+    argparser.add_argument('--seed', type=int, default=0, help='The seed of the random inputs. Default: 0')
+    argparser.add_argument('--passes', type=positive_int, default=2, help='The number of passes. Default: 2')
+    argparser.add_argument('--workers', type=positive_int, default=1, help='The number of worker processes. Default: 1')
+    argparser.add_argument('--chunk-size', type=positive_int, default=5000,
+                           help='The number of cases checked at once. Default: 5000')
+    argparser.add_argument('--max-counterexamples', type=non_negative_int, default=10,
+                           help='The maximal number of reported differences per chunk and engine. Default: 10')
+    opts = argparser.parse_args()
+
+    corpus_words = read_corpus_words(opts.corpus) if opts.corpus is not None else ()
+    start = time.perf_counter()
+    checked, counterexamples = check(opts.cases, opts.engines, opts.seed, corpus_words, opts.passes, opts.workers,
+                                     opts.chunk_size, opts.max_counterexamples)
+    elapsed = time.perf_counter() - start
+
+    for counterexample in counterexamples:
+        print(format_counterexample(counterexample), file=sys.stderr)
+    print('{0} cases checked with {1} engines in {2:.1f} s ({3:.0f} cases/min), {4} differences'.format(
+        checked, len(opts.engines), elapsed, checked / elapsed * 60 if elapsed else 0.0, len(counterexamples)),
+        file=sys.stderr)
+    sys.exit(1 if counterexamples else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, vim: expandtab:ts=4 -*-
+
+import os
+import sys
+import mmap
+import json
+import struct
+import hashlib
+import argparse
+from zlib import crc32
+from collections import Counter
+from typing import Dict, Iterable, Optional
+
+from emphon.argparser import positive_int
+from emphon.version import __version__
+
+MAGIC = b'EMPHONLX'
+FORMAT_VERSION = 1
+# magic, format version, number of entries, size of the hash table, passes, fingerprint
+_HEADER = struct.Struct('<8sIIII32s')
+_UINT = struct.Struct('<I')
+_UINT_PAIR = struct.Struct('<II')
+
+
+def lexicon_fingerprint(ipaize: bool = True, optional_palatal_assimilation: bool = False, passes: int = 2) -> bytes:
+    """
+    The fingerprint of the transcriber with the given options: it changes when the version, the rules (the source of
+    the transcriber) or the IPA key change, so a stale lexicon is never used
+    :param ipaize: whether the output uses the inner representation or the IPA form
+    :param optional_palatal_assimilation: optional palatal assimilation in cases like `lapátnyél`
+    :param passes: the number of passes of the transcriber
+    :return: the SHA-256 digest
+    """
+    digest = hashlib.sha256(json.dumps({'format': FORMAT_VERSION, 'version': __version__, 'ipaize': ipaize,
+                                        'optional_palatal_assimilation': optional_palatal_assimilation,
+                                        'passes': passes}, sort_keys=True).encode('UTF-8'))
+    sources = ['transcriber.py'] + (['ipa_key.json'] if ipaize else [])
+    for source in sources:
+        with open(os.path.join(os.path.dirname(__file__), source), 'rb') as infile:
+            digest.update(infile.read())
+    return digest.digest()
+
+
+class Lexicon:
+    """
+    Read-only, memory-mapped pronunciation lexicon (segmented word -> transcription). The file is mapped into the
+    memory, so the processes using the same file share its pages instead of copying it.
+    Layout (little-endian 32-bit integers): header, key offsets, value offsets (entries sorted by key),
+    open addressing hash table of the entry indices (+1, 0 is empty), UTF-8 keys, UTF-8 values.
+    """
+    def __init__(self, path: str, fingerprint: bytes = None):
+        """
+        :param path: the lexicon file
+        :param fingerprint: the expected fingerprint (see `lexicon_fingerprint`), not checked if None
+        """
+        with open(path, 'rb') as infile:
+            try:
+                self._mm = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # An empty file cannot be mapped
+                raise ValueError('{0} is not an emPhon lexicon of format version {1}!'.format(path, FORMAT_VERSION))
+
+        if len(self._mm) < _HEADER.size:
+            magic = format_version = None
+        else:
+            magic, format_version, self._size, table_size, self.passes, self.fingerprint = \
+                _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            self._mm.close()
+            raise ValueError('{0} is not an emPhon lexicon of format version {1}!'.format(path, FORMAT_VERSION))
+        if fingerprint is not None and fingerprint != self.fingerprint:
+            self._mm.close()
+            raise ValueError('The lexicon {0} was built with a different version or options of the transcriber, '
+                             'please rebuild it!'.format(path))
+
+        self._mask = table_size - 1
+        self._key_offsets = _HEADER.size
+        self._value_offsets = self._key_offsets + 4 * (self._size + 1)
+        self._table = self._value_offsets + 4 * (self._size + 1)
+        self._keys = self._table + 4 * table_size
+        self._values = self._keys + _UINT.unpack_from(self._mm, self._key_offsets + 4 * self._size)[0]
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, word: str) -> Optional[str]:
+        """
+        :param word: the segmented word
+        :return: the transcription of the word or None if it is not in the lexicon
+        """
+        mm = self._mm
+        key = word.encode('UTF-8')
+        slot = crc32(key) & self._mask
+        while True:
+            index = _UINT.unpack_from(mm, self._table + 4 * slot)[0]
+            if index == 0:
+                self.misses += 1
+                return None
+            index -= 1
+            start, end = _UINT_PAIR.unpack_from(mm, self._key_offsets + 4 * index)
+            if mm[self._keys + start:self._keys + end] == key:
+                self.hits += 1
+                start, end = _UINT_PAIR.unpack_from(mm, self._value_offsets + 4 * index)
+                return mm[self._values + start:self._values + end].decode('UTF-8')
+            slot = (slot + 1) & self._mask
+
+    def __len__(self):
+        return self._size
+
+    def close(self):
+        self._mm.close()
+
+    @staticmethod
+    def write(path: str, entries: Dict[str, str], fingerprint: bytes, passes: int = 2):
+        """
+        Writes the lexicon file
+        :param path: the output file
+        :param entries: segmented word -> transcription
+        :param fingerprint: the fingerprint of the transcriber which produced the transcriptions
+        :param passes: the number of passes of the transcriber
+        """
+        items = sorted((key.encode('UTF-8'), value.encode('UTF-8')) for key, value in entries.items())
+        table_size = 1
+        while table_size < 2 * len(items):  # At most half full
+            table_size *= 2
+
+        table = [0] * table_size
+        mask = table_size - 1
+        for index, (key, _) in enumerate(items):
+            slot = crc32(key) & mask
+            while table[slot] != 0:
+                slot = (slot + 1) & mask
+            table[slot] = index + 1
+
+        key_offsets, value_offsets = [0], [0]
+        for key, value in items:
+            key_offsets.append(key_offsets[-1] + len(key))
+            value_offsets.append(value_offsets[-1] + len(value))
+
+        with open(path, 'wb') as outfile:
+            outfile.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(items), table_size, passes, fingerprint))
+            for array in (key_offsets, value_offsets, table):
+                outfile.write(struct.pack('<{0}I'.format(len(array)), *array))
+            outfile.write(b''.join(key for key, _ in items))
+            outfile.write(b''.join(value for _, value in items))
+
+
+def build_lexicon(lines: Iterable[str], path: str, ipaize: bool = True, optional_palatal_assimilation: bool = False,
+                  passes: int = 2, max_entries: int = None, min_count: int = 1, conllu_comments: bool = False) -> int:
+    """
+    Builds a lexicon from the most frequent segmented words of an emtsv corpus
+    :param lines: the lines of the corpus (including the header)
+    :param path: the output file
+    :param ipaize: whether the output uses the inner representation or the IPA form
+    :param optional_palatal_assimilation: optional palatal assimilation in cases like `lapátnyél`
+    :param passes: the number of passes of the transcriber
+    :param max_entries: the maximal number of entries (the most frequent words are kept), unlimited if None
+    :param min_count: the minimal frequency of the entries
+    :param conllu_comments: whether the `# ` lines before the sentences are comments (as in the CoNLL-U format)
+    :return: the number of entries
+    """
+    from emphon.transcriber import Transcriber
+    from emphon.tsv import read_header, read_sentences
+
+    lines = iter(lines)
+    _, field_names = read_header(lines, {'form', 'anas'})
+    counts = Counter()
+    for _, sentence in read_sentences(lines, conllu_comments):
+        counts.update(Transcriber.segment(sentence, field_names))
+
+    words = [word for word, count in counts.most_common(max_entries) if count >= min_count]
+    transcriber = Transcriber(ipaize=ipaize, optional_palatal_assimilation=optional_palatal_assimilation,
+                              cache=False)
+    Lexicon.write(path, dict(zip(words, transcriber.transcribe_batch(words, passes))),
+                  lexicon_fingerprint(ipaize, optional_palatal_assimilation, passes), passes)
+    return len(words)
+
+
+def main():
+
+    argparser = argparse.ArgumentParser(description='Builds a pronunciation lexicon of the frequent words of an emtsv '
+                                                    'corpus for emPhon (see the --lexicon option)')
+    argparser.add_argument('-i', '--input', dest='input_stream', type=argparse.FileType('r', encoding='UTF-8'),
+                           default=sys.stdin, help='Use input file instead of STDIN')
+    argparser.add_argument('-o', '--output', required=True, help='The lexicon file')
+    argparser.add_argument('--no-ipaize', dest='ipaize', action='store_false',
+                           help='Use the emPhon inner representation instead of IPA')
+    argparser.add_argument('--opt-palatal-assim', dest='opt_palatal_assim', action='store_true',
+                           help='Optional palatal assimilation with t/d+ny, e.g. lapátnyél -> lapátynyél')
+    argparser.add_argument('--max-entries', type=positive_int, default=None,
+                           help='The maximal number of entries, the most frequent words are kept. Default: unlimited')
+    argparser.add_argument('--min-count', type=positive_int, default=1,
+                           help='The minimal frequency of the entries. Default: 1')
+    argparser.add_argument('--conllu-comments', dest='conllu_comments', action='store_true',
+                           help='Enable CoNLL-U style comments')
+    opts = argparser.parse_args()
+
+    try:
+        size = build_lexicon(opts.input_stream, opts.output, opts.ipaize, opts.opt_palatal_assim,
+                             max_entries=opts.max_entries, min_count=opts.min_count,
+                             conllu_comments=opts.conllu_comments)
+    except ValueError as e:
+        argparser.error(str(e))
+    print('{0} entries written to {1}'.format(size, opts.output), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+from collections import OrderedDict, namedtuple
+from typing import Hashable, Optional
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'evictions', 'maxsize', 'currsize'])
+
+
+class LRUCache:
+    """
+    Bounded cache which evicts the least recently used item, with hit, miss and eviction statistics
+    """
+    def __init__(self, maxsize: int):
+        """
+        :param maxsize: the maximal number of items
+        """
+        if maxsize < 1:
+            raise ValueError('The size of the cache must be positive!')
+
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[object]:
+        """
+        :param key: the key of the item
+        :return: the item or None (counted as a miss) if the key is not in the cache
+        """
+        value = self._items.get(key)
+        if value is not None:
+            self.hits += 1
+            self._items.move_to_end(key)
+        else:
+            self.misses += 1
+        return value
+
+    def put(self, key: Hashable, value: object):
+        """
+        Stores the item (which must not be None) and evicts the least recently used one if the cache is full
+        :param key: the key of the item
+        :param value: the item
+        """
+        self._items[key] = value
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def info(self) -> CacheInfo:
+        """
+        :return: the statistics in the style of `functools.lru_cache`
+        """
+        return CacheInfo(self.hits, self.misses, self.evictions, self.maxsize, len(self._items))
+
+    def clear(self):
+        """
+        Empties the cache and resets its statistics
+        """
+        self._items.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,91 @@
+import os
+from collections import deque
+from itertools import islice
+from typing import Iterable, List, TextIO, Tuple
+
+from emphon.emphon import EmPhon
+from emphon.transcriber import merge_rule_profiles
+from emphon.tsv import read_header, read_sentences, format_sentence
+
+# The EmPhon instance of the worker process, created once by the initializer of the pool
+_worker_emphon = None
+_worker_field_names = None
+
+
+def _init_worker(emphon_kwargs: dict, field_names: dict):
+    global _worker_emphon, _worker_field_names
+    _worker_emphon = EmPhon(**emphon_kwargs)
+    _worker_field_names = _worker_emphon.prepare_fields(field_names)
+
+
+def _process_chunk(chunk: List[Tuple[List[str], List[List[str]]]]) -> Tuple[str, dict]:
+    processed = _worker_emphon.process_sentences([sentence for _, sentence in chunk], _worker_field_names)
+    # The rule statistics of the chunk are sent back with the output
+    rule_profile = _worker_emphon.transcriber.rule_profile()
+    _worker_emphon.transcriber.reset_rule_profile()
+    return ''.join(format_sentence(comments, sentence) for (comments, _), sentence in zip(chunk, processed)), \
+        rule_profile
+
+
+def _chunks(iterable: Iterable, chunk_size: int):
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, chunk_size))
+
+
+def process_parallel(input_stream: Iterable[str], output_stream: TextIO, emphon_kwargs: dict = None,
+                     workers: int = None, chunk_size: int = 1000, max_in_flight: int = None,
+                     conllu_comments: bool = False) -> dict:
+    """
+    Processes an emtsv stream in a process pool. The input is split into chunks of whole sentences, each worker
+    builds its own EmPhon once and the processed chunks are written in the original order. At most `max_in_flight`
+    chunks are read ahead, so the memory usage is bounded regardless of the size of the input.
+    :param input_stream: the input lines (including the header)
+    :param output_stream: the output to write to
+    :param emphon_kwargs: the keyword arguments of EmPhon
+    :param workers: the number of worker processes, the number of CPUs by default
+    :param chunk_size: the number of sentences in a chunk
+    :param max_in_flight: the maximal number of chunks under processing, two per worker by default
+    :param conllu_comments: whether the `# ` lines before the sentences are comments which are passed through
+    :return: the summed rule statistics of the workers (empty unless the `profile_rules` transcriber option is on)
+    """
+    if emphon_kwargs is None:
+        emphon_kwargs = dict()
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if max_in_flight is None:
+        max_in_flight = 2 * workers
+
+    # Fail early in the parent process as a failing initializer would make the pool restart its workers forever
+    EmPhon(**emphon_kwargs)
+
+    lines = iter(input_stream)
+    header, field_names = read_header(lines, emphon_kwargs.get('source_fields', set()))
+    output_stream.write('\t'.join(header + list(emphon_kwargs.get('target_fields', []))) + '\n')
+
+    rule_profile = {}
+
+    def write_result(result):
+        nonlocal rule_profile
+        text, chunk_rule_profile = result.get()
+        output_stream.write(text)
+        if chunk_rule_profile:
+            rule_profile = merge_rule_profiles((rule_profile, chunk_rule_profile))
+
+    from multiprocessing import Pool  # Not imported at startup, as the module is imported by the package
+
+    with Pool(workers, initializer=_init_worker, initargs=(emphon_kwargs, field_names)) as pool:
+        in_flight = deque()
+        for chunk in _chunks(read_sentences(lines, conllu_comments), chunk_size):
+            if len(in_flight) >= max_in_flight:
+                write_result(in_flight.popleft())
+            in_flight.append(pool.apply_async(_process_chunk, (chunk,)))
+
+        while in_flight:
+            write_result(in_flight.popleft())
+
+    return rule_profile
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, vim: expandtab:ts=4 -*-
+
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+from collections import deque
+from multiprocessing import Pool
+from socketserver import ThreadingMixIn
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import List, Tuple
+
+from emphon.argparser import non_negative_int, positive_int
+from emphon.emphon import EmPhon
+
+# The kinds of the requests and the type of their payload
+REQUEST_KINDS = ('words', 'sentence', 'sentences')
+# The percentiles of the latency reported by the statistics
+PERCENTILES = (50, 90, 99, 99.9)
+
+# The EmPhon instance of the worker process (or of the batching thread without workers)
+_worker_emphon = None
+_worker_field_names = None
+
+
+def _init_worker(emphon_kwargs: dict):
+    global _worker_emphon, _worker_field_names
+    _worker_emphon = EmPhon(**emphon_kwargs)
+    _worker_field_names = _worker_emphon.prepare_fields({'form': 0, 'anas': 1})
+    # Warm up the caches of the segmentation and the transcriber before the first request
+    _process_batch([('sentence', [{'form': 'Alma', 'anas': '[]'}]), ('words', ['körte'])])
+
+
+def _process_batch(requests: List[Tuple[str, list]]) -> list:
+    """
+    Processes a micro-batch: the sentences of all requests are processed in one call and the words in one batch.
+    If the batch fails, its requests are processed one by one, so a bad request (e.g. with an invalid `anas` field)
+    only fails itself
+    :return: the result of each request, or a ValueError for the failed requests
+    """
+    try:
+        return _process_requests(requests)
+    except Exception:
+        pass
+
+    results = []
+    for request in requests:
+        try:
+            results.extend(_process_requests([request]))
+        except Exception as e:
+            results.append(ValueError('The request could not be processed ({0}: {1})!'.format(type(e).__name__, e)))
+    return results
+
+
+def _process_requests(requests: List[Tuple[str, list]]) -> List[dict]:
+    emphon = _worker_emphon
+    sentences = [[[token['form'], token['anas']] for token in sentence]
+                 for kind, payload in requests if kind != 'words'
+                 for sentence in (payload if kind == 'sentences' else [payload])]
+    processed = iter(emphon.process_sentences(sentences, _worker_field_names))
+    # The words are lowercased as the forms of the tokens by the segmentation
+    words = [word.lower() for kind, payload in requests if kind == 'words' for word in payload]
+    word_values = iter(emphon.output_values(emphon.transcriber.transcribe_batch(words)))
+
+    def sentence_result(sentence):
+        # The comment lines (if any) precede the tokens, the target fields follow the form and anas fields
+        comments = len(sentence) - next_sizes.popleft()
+        return {'comments': ['\t'.join(comment) for comment in sentence[:comments]],
+                'tokens': [dict(zip(emphon.target_fields, token[2:])) for token in sentence[comments:]]}
+
+    next_sizes = deque(len(sentence) for sentence in sentences)
+    results = []
+    for kind, payload in requests:
+        if kind == 'words':
+            results.append({'words': [dict(zip(emphon.target_fields, next(word_values))) for _ in payload]})
+        elif kind == 'sentence':
+            results.append({'sentence': sentence_result(next(processed))})
+        else:
+            results.append({'sentences': [sentence_result(next(processed)) for _ in payload]})
+    return results
+
+
+def parse_request(request: dict) -> Tuple[str, list]:
+    """
+    Checks a request: exactly one of `words` (list of words), `sentence` (list of tokens with `form` and `anas`) and
+    `sentences` (list of sentences)
+    :param request: the decoded JSON request
+    :return: the kind and the payload of the request
+    """
+    if not isinstance(request, dict) or len(request) != 1 or next(iter(request)) not in REQUEST_KINDS:
+        raise ValueError('The request must have exactly one of the keys {0}!'.format(', '.join(REQUEST_KINDS)))
+    kind, payload = next(iter(request.items()))
+    if not isinstance(payload, list):
+        raise ValueError('{0} must be a list!'.format(kind))
+    if kind == 'words':
+        if not all(isinstance(word, str) for word in payload):
+            raise ValueError('words must be a list of strings!')
+    else:
+        for sentence in (payload if kind == 'sentences' else [payload]):
+            if not isinstance(sentence, list) or \
+                    not all(isinstance(token, dict) and isinstance(token.get('form'), str) and
+                            isinstance(token.get('anas'), str) for token in sentence):
+                raise ValueError('A sentence must be a list of tokens with string form and anas fields!')
+    return kind, payload
+
+
+class _Request:
+    __slots__ = ('kind', 'payload', 'received', 'done', 'result', 'error')
+
+    def __init__(self, kind: str, payload: list):
+        self.kind = kind
+        self.payload = payload
+        self.received = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """
+    Coalesces the concurrent requests into micro-batches: a batch is sent to the processing when it has
+    `max_batch_size` requests or `max_wait` seconds passed since its first request arrived. The batches are processed
+    by worker processes which keep their EmPhon instance (and its caches) between the requests, or by the batching
+    thread itself without workers.
+    """
+    def __init__(self, emphon_kwargs: dict = None, workers: int = 1, max_batch_size: int = 64, max_wait: float = 0.002,
+                 max_in_flight: int = None, window: int = 10000):
+        """
+        :param emphon_kwargs: the keyword arguments of EmPhon
+        :param workers: the number of worker processes, 0 processes the batches in the batching thread
+        :param max_batch_size: the maximal number of requests in a batch
+        :param max_wait: the maximal time (in seconds) a request waits for other requests to form a batch
+        :param max_in_flight: the maximal number of batches under processing, two per worker by default
+        :param window: the number of the latest requests the latency percentiles are computed from
+        """
+        if emphon_kwargs is None:
+            emphon_kwargs = dict()
+        if workers < 0 or max_batch_size < 1 or max_wait < 0:
+            raise ValueError('workers must not be negative, max_batch_size must be positive and max_wait must not be '
+                             'negative!')
+
+        # Fail early in the parent process as a failing initializer would make the pool restart its workers forever
+        _init_worker(emphon_kwargs)
+        self._pool = Pool(workers, initializer=_init_worker, initargs=(emphon_kwargs,)) if workers > 0 else None
+
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._slots = threading.BoundedSemaphore(max_in_flight or 2 * max(workers, 1))
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self._in_flight = 0
+        self._requests = 0
+        self._batches = 0
+        self._errors = 0
+        self._started = time.time()
+        self._closed = False
+        self._thread = threading.Thread(target=self._batch_loop, name='emphon-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, kind: str, payload: list, timeout: float = None) -> dict:
+        """
+        Processes a request (see `parse_request`) in the next micro-batch and waits for the result
+        :param kind: the kind of the request
+        :param payload: the words, the sentence or the sentences
+        :param timeout: the maximal time to wait in seconds, forever if None
+        :return: the result of the request
+        """
+        if self._closed:
+            raise RuntimeError('The service is closed!')
+        request = _Request(kind, payload)
+        self._queue.put(request)
+        if not request.done.wait(timeout):
+            raise TimeoutError('The request timed out!')
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _batch_loop(self):
+        while True:
+            request = self._queue.get()
+            if request is None:
+                break
+            batch = [request]
+            deadline = request.received + self.max_wait
+            while len(batch) < self.max_batch_size:
+                try:
+                    remaining = deadline - time.perf_counter()
+                    request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._queue.put(None)  # Stop after this batch
+                    break
+                batch.append(request)
+            self._dispatch(batch)
+
+    def _dispatch(self, batch: List[_Request]):
+        self._slots.acquire()
+        with self._lock:
+            self._in_flight += len(batch)
+            self._batches += 1
+        payload = [(request.kind, request.payload) for request in batch]
+        if self._pool is None:
+            try:
+                self._finish(batch, _process_batch(payload))
+            except Exception as e:
+                self._fail(batch, e)
+        else:
+            self._pool.apply_async(_process_batch, (payload,), callback=lambda results: self._finish(batch, results),
+                                   error_callback=lambda e: self._fail(batch, e))
+
+    def _finish(self, batch: List[_Request], results: List[dict]):
+        now = time.perf_counter()
+        errors = sum(isinstance(result, Exception) for result in results)
+        with self._lock:
+            self._in_flight -= len(batch)
+            self._requests += len(batch) - errors
+            self._errors += errors
+            self._latencies.extend(now - request.received for request, result in zip(batch, results)
+                                   if not isinstance(result, Exception))
+        self._slots.release()
+        for request, result in zip(batch, results):
+            if isinstance(result, Exception):
+                request.error = result
+            else:
+                request.result = result
+            request.done.set()
+
+    def _fail(self, batch: List[_Request], error: Exception):
+        with self._lock:
+            self._in_flight -= len(batch)
+            self._errors += len(batch)
+        self._slots.release()
+        for request in batch:
+            request.error = error
+            request.done.set()
+
+    def stats(self) -> dict:
+        """
+        :return: the number of requests, batches and errors, the mean batch size, the number of waiting (not yet
+         batched) and in-flight (batched, under processing) requests and the latency percentiles in milliseconds
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {'uptime_seconds': round(time.time() - self._started, 3),
+                     'requests': self._requests,
+                     'errors': self._errors,
+                     'batches': self._batches,
+                     'mean_batch_size': round((self._requests + self._errors + self._in_flight) /
+                                              self._batches, 3) if self._batches else 0.0,
+                     'queue_depth': self._queue.qsize(),
+                     'in_flight': self._in_flight}
+        stats['latency_ms'] = {'p{0:g}'.format(percentile): round(
+            1000 * latencies[min(len(latencies) - 1, int(len(latencies) * percentile / 100))], 3) if latencies else
+            None for percentile in PERCENTILES}
+        return stats
+
+    def close(self):
+        """
+        Processes the waiting requests and stops the batching thread and the workers
+        """
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def _reply(self, status: int, body: dict):
+        data = json.dumps(body, ensure_ascii=False).encode('UTF-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._reply(200, self.server.batcher.stats())
+        elif self.path == '/health':
+            self._reply(200, {'status': 'ok'})
+        else:
+            self._reply(404, {'error': 'Unknown path {0}, use POST /transcribe, GET /stats or GET /health!'.format(
+                self.path)})
+
+    def do_POST(self):
+        if self.path != '/transcribe':
+            self._reply(404, {'error': 'Unknown path {0}, use POST /transcribe!'.format(self.path)})
+            return
+        try:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            kind, payload = parse_request(json.loads(body.decode('UTF-8')))
+        except ValueError as e:  # Including the JSON and the Unicode errors
+            self._reply(400, {'error': str(e)})
+            return
+        try:
+            self._reply(200, self.server.batcher.submit(kind, payload, self.server.request_timeout))
+        except ValueError as e:  # The request failed in the processing
+            self._reply(400, {'error': str(e)})
+        except TimeoutError as e:
+            self._reply(503, {'error': str(e)})
+        except Exception as e:
+            self._reply(500, {'error': '{0}: {1}'.format(type(e).__name__, e)})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class ServiceServer(ThreadingMixIn, HTTPServer):
+    """
+    HTTP server of a `MicroBatcher`, each connection is handled in its own thread:
+    `POST /transcribe` with a JSON request (see `parse_request`), `GET /stats` (see `MicroBatcher.stats`) and
+    `GET /health`
+    """
+    daemon_threads = True
+    # The connections waiting to be accepted: the default of 5 resets the connections of a burst of concurrent clients
+    request_queue_size = 128
+
+    def __init__(self, address: Tuple[str, int], batcher: MicroBatcher, request_timeout: float = None,
+                 verbose: bool = False):
+        """
+        :param address: the host and the port to listen on
+        :param batcher: the batcher which processes the requests
+        :param request_timeout: the maximal time (in seconds) a request waits for its result, forever if None
+        :param verbose: whether the requests are logged to STDERR
+        """
+        super().__init__(address, _Handler)
+        self.batcher = batcher
+        self.request_timeout = request_timeout
+        self.verbose = verbose
+
+
+def main():
+    from emphon.stream import add_emphon_args, emphon_kwargs_from_opts
+
+    argparser = argparse.ArgumentParser(
+        description='EmPhon - a local HTTP transcription service which processes the concurrent requests in '
+                    'micro-batches with preloaded EmPhon instances')
+    argparser.add_argument('--host', dest='host', default='127.0.0.1', help='The host to listen on. Default: 127.0.0.1')
+    argparser.add_argument('--port', dest='port', type=int, default=8080, help='The port to listen on. Default: 8080')
+    argparser.add_argument('--workers', dest='workers', type=non_negative_int, default=1,
+                           help='The number of worker processes, 0 processes the requests in the server process. '
+                                'Default: 1')
+    argparser.add_argument('--max-batch-size', dest='max_batch_size', type=positive_int, default=64,
+                           help='The maximal number of requests in a micro-batch. Default: 64')
+    argparser.add_argument('--max-wait-ms', dest='max_wait_ms', type=float, default=2.0,
+                           help='The maximal time a request waits for other requests to form a micro-batch. '
+                                'Default: 2 ms')
+    argparser.add_argument('--request-timeout', dest='request_timeout', type=float, default=None,
+                           help='The maximal time (in seconds) a request waits for its result. Default: no limit')
+    argparser.add_argument('--verbose', dest='verbose', action='store_true', help='Log the requests to STDERR')
+    add_emphon_args(argparser)
+    opts = argparser.parse_args()
+
+    emphon_kwargs = emphon_kwargs_from_opts(argparser, opts)
+    try:
+        batcher = MicroBatcher(emphon_kwargs, opts.workers, opts.max_batch_size, opts.max_wait_ms / 1000)
+    except ValueError as e:
+        argparser.error(str(e))
+
+    server = ServiceServer((opts.host, opts.port), batcher, opts.request_timeout, opts.verbose)
+    print('emPhon service listening on http://{0}:{1}'.format(*server.server_address[:2]), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, vim: expandtab:ts=4 -*-
+
+import os
+import sys
+import mmap
+import json
+import shutil
+import struct
+import argparse
+from array import array
+from bisect import bisect_left
+from typing import List, Tuple
+
+from emphon.argparser import positive_int
+from emphon.emphon import EmPhon
+from emphon.transcriber import format_rule_profile
+from emphon.tsv import read_header, split_block, format_sentence
+
+INDEX_MAGIC = b'EMPHONIX'
+INDEX_FORMAT_VERSION = 1
+# magic, format version, size and modification time (ns) of the indexed file, end of the header, number of sentences
+_INDEX_HEADER = struct.Struct('<8sIQQQQ')
+
+
+class SentenceIndex:
+    """
+    The byte offsets of the sentences of an emtsv file: the first byte of each sentence (the first line after the
+    header or after empty lines). The sentences between two offsets can be processed without reading the rest of the
+    file, so the file can be cut into shards at any sentence boundary.
+    """
+    def __init__(self, size: int, mtime_ns: int, header_end: int, offsets: array):
+        """
+        :param size: the size of the indexed file in bytes
+        :param mtime_ns: the modification time of the indexed file in nanoseconds
+        :param header_end: the offset of the first byte after the header line
+        :param offsets: the offsets of the sentences in increasing order (array of 64-bit integers)
+        """
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.header_end = header_end
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @classmethod
+    def build(cls, path: str) -> 'SentenceIndex':
+        """
+        Scans the file once through a memory map
+        :param path: the emtsv file
+        :return: the index of the file
+        """
+        stat = os.stat(path)
+        offsets = array('Q')
+        if stat.st_size == 0:
+            return cls(0, stat.st_mtime_ns, 0, offsets)
+
+        with open(path, 'rb') as infile, mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            header_end = mm.find(b'\n') + 1 or size
+            position = header_end
+            while position < size:
+                # Skip the empty lines before the sentence
+                while position < size and mm[position] == 0x0a:
+                    position += 1
+                if position == size:
+                    break
+                offsets.append(position)
+                boundary = mm.find(b'\n\n', position)
+                position = size if boundary == -1 else boundary + 2
+
+        return cls(size, stat.st_mtime_ns, header_end, offsets)
+
+    def save(self, path: str):
+        """
+        :param path: the index file
+        """
+        with open(path, 'wb') as outfile:
+            outfile.write(_INDEX_HEADER.pack(INDEX_MAGIC, INDEX_FORMAT_VERSION, self.size, self.mtime_ns,
+                                             self.header_end, len(self.offsets)))
+            self.offsets.tofile(outfile)
+
+    @classmethod
+    def load(cls, path: str, source: str = None) -> 'SentenceIndex':
+        """
+        :param path: the index file
+        :param source: the indexed file, the index is rejected if the file changed since the indexing (not checked if
+         None)
+        :return: the index
+        """
+        with open(path, 'rb') as infile:
+            magic, format_version, size, mtime_ns, header_end, count = \
+                _INDEX_HEADER.unpack(infile.read(_INDEX_HEADER.size))
+            if magic != INDEX_MAGIC or format_version != INDEX_FORMAT_VERSION:
+                raise ValueError('{0} is not an emPhon sentence index of format version {1}!'.format(
+                    path, INDEX_FORMAT_VERSION))
+            offsets = array('Q')
+            offsets.fromfile(infile, count)
+
+        if source is not None:
+            stat = os.stat(source)
+            if stat.st_size != size or stat.st_mtime_ns != mtime_ns:
+                raise ValueError('{0} changed since the index {1} was built, please rebuild it!'.format(source, path))
+        return cls(size, mtime_ns, header_end, offsets)
+
+    def shards(self, shards: int) -> List[Tuple[int, int]]:
+        """
+        Cuts the sentences into shards of about the same size in bytes
+        :param shards: the number of shards
+        :return: the start and end offsets of each shard (the end is the start of the next one)
+        """
+        if shards < 1:
+            raise ValueError('The number of shards must be positive!')
+        body = self.size - self.header_end
+        starts = [self.header_end]
+        for k in range(1, shards):
+            i = bisect_left(self.offsets, self.header_end + body * k // shards)
+            starts.append(max(starts[-1], self.offsets[i] if i < len(self.offsets) else self.size))
+        return list(zip(starts, starts[1:] + [self.size]))
+
+
+def index_path(path: str) -> str:
+    """
+    :param path: the emtsv file
+    :return: the default path of its sentence index
+    """
+    return path + '.idx'
+
+
+def load_or_build_index(path: str, index: str = None) -> SentenceIndex:
+    """
+    :param path: the emtsv file
+    :param index: the index file, the default (see `index_path`) if None, built in the memory if it does not exist
+    :return: the index of the file
+    """
+    if index is None:
+        index = index_path(path)
+    if os.path.exists(index):
+        return SentenceIndex.load(index, path)
+    return SentenceIndex.build(path)
+
+
+def parse_shard(shard: str) -> Tuple[int, int]:
+    """
+    :param shard: the shard in the form `k/N` (1 <= k <= N)
+    :return: k and N
+    """
+    try:
+        k, n = (int(number) for number in shard.split('/'))
+    except ValueError:
+        raise ValueError('The shard must be in the form k/N, e.g. 3/8, not {0!r}!'.format(shard))
+    if not 1 <= k <= n:
+        raise ValueError('The shard number must be between 1 and {0}, not {1}!'.format(n, k))
+    return k, n
+
+
+def _read_checkpoint(path: str, shard: str, index: SentenceIndex, output_path: str) -> dict:
+    # A checkpoint of another shard or of another version of the input is ignored, as well as a checkpoint whose
+    # output was deleted or cut since
+    try:
+        with open(path, encoding='UTF-8') as infile:
+            checkpoint = json.load(infile)
+        output_size = os.path.getsize(output_path)
+    except (OSError, ValueError):
+        return None
+    if checkpoint.get('shard') != shard or checkpoint.get('size') != index.size or \
+            checkpoint.get('mtime_ns') != index.mtime_ns or output_size < checkpoint.get('output_size', 0):
+        return None
+    return checkpoint
+
+
+def _preceding_comments(mm: mmap.mmap, index: SentenceIndex, start: int) -> List[str]:
+    # The comments separated by empty lines from the first sentence of the shard belong to that sentence (see
+    # `read_sentences`), but they are in the previous shard which drops them
+    comments = []
+    i = bisect_left(index.offsets, start)
+    while i > 0:
+        lines = [line for line in mm[index.offsets[i - 1]:start].decode('UTF-8').split('\n') if len(line) > 0]
+        if not all(line.startswith('# ') for line in lines):
+            break
+        comments[:0] = lines
+        i, start = i - 1, index.offsets[i - 1]
+    return comments
+
+
+def _write_checkpoint(path: str, checkpoint: dict):
+    # Replaced atomically, so a killed job leaves either the previous or the new checkpoint
+    with open(path + '.tmp', 'w', encoding='UTF-8') as outfile:
+        json.dump(checkpoint, outfile)
+        outfile.flush()
+        os.fsync(outfile.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def process_shard(input_path: str, output_path: str, shard: str, emphon_kwargs: dict = None, index: str = None,
+                  checkpoint_every: int = 1000, conllu_comments: bool = False) -> EmPhon:
+    """
+    Processes the sentences of shard k/N of an emtsv file (see `SentenceIndex.shards`) into a separate output file,
+    which has the header line, so it is a complete emtsv file on its own.
+    The progress is saved to `output_path + '.checkpoint'` after every `checkpoint_every` sentences: a killed job
+    continues from the last checkpoint when it is started again, and a finished shard is not processed again.
+    :param input_path: the emtsv file
+    :param output_path: the output file of the shard
+    :param shard: the shard in the form `k/N`
+    :param emphon_kwargs: the keyword arguments of EmPhon
+    :param index: the sentence index of the file (see `load_or_build_index`)
+    :param checkpoint_every: the number of sentences between two checkpoints
+    :param conllu_comments: whether the `# ` lines before the sentences are comments which are passed through
+    :return: the EmPhon instance used, e.g. to access the statistics of its transcriber
+    """
+    if emphon_kwargs is None:
+        emphon_kwargs = dict()
+    if checkpoint_every < 1:
+        raise ValueError('checkpoint_every must be positive!')
+
+    k, n = parse_shard(shard)
+    emphon = EmPhon(**emphon_kwargs)
+    sentence_index = load_or_build_index(input_path, index)
+    start, end = sentence_index.shards(n)[k - 1]
+    checkpoint_path = output_path + '.checkpoint'
+    checkpoint = _read_checkpoint(checkpoint_path, shard, sentence_index, output_path)
+    if checkpoint is not None and checkpoint['done']:
+        return emphon
+
+    with open(input_path, 'rb') as infile, mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        header, field_names = read_header(iter([mm[:sentence_index.header_end].decode('UTF-8')]),
+                                          emphon.source_fields)
+        field_names = emphon.prepare_fields(field_names)
+
+        if checkpoint is None:
+            position = start
+            comments = _preceding_comments(mm, sentence_index, start) if conllu_comments else []
+            output = open(output_path, 'w', encoding='UTF-8')
+            output.write('\t'.join(header + list(emphon.target_fields)) + '\n')
+        else:
+            # The output written after the checkpoint is dropped, its sentences are processed again
+            position, comments = checkpoint['position'], checkpoint.get('comments', [])
+            with open(output_path, 'r+b') as outfile:
+                outfile.truncate(checkpoint['output_size'])
+            output = open(output_path, 'a', encoding='UTF-8')
+
+        with output:
+            offsets = sentence_index.offsets
+            i = bisect_left(offsets, position)
+            while position < end:
+                i += checkpoint_every
+                block_end = min(offsets[i] if i < len(offsets) else sentence_index.size, end)
+                # The comments at the end of the block belong to the first sentence of the next one
+                block, comments = split_block(mm[position:block_end].decode('UTF-8'), conllu_comments, comments)
+                processed = emphon.process_sentences([sentence for _, sentence in block], field_names)
+                output.write(''.join(format_sentence(sentence_comments, sentence)
+                                     for (sentence_comments, _), sentence in zip(block, processed)))
+                output.flush()
+                os.fsync(output.fileno())
+                position = block_end
+                _write_checkpoint(checkpoint_path, {'shard': shard, 'size': sentence_index.size,
+                                                    'mtime_ns': sentence_index.mtime_ns, 'position': position,
+                                                    'output_size': output.tell(), 'comments': comments,
+                                                    'done': position >= end})
+            if start == end:
+                _write_checkpoint(checkpoint_path, {'shard': shard, 'size': sentence_index.size,
+                                                    'mtime_ns': sentence_index.mtime_ns, 'position': end,
+                                                    'output_size': output.tell(), 'done': True})
+
+    return emphon
+
+
+def merge_shards(shard_paths: List[str], output_path: str):
+    """
+    Concatenates the outputs of the shards in the given order, keeping only the header of the first one.
+    Every shard must be finished: its checkpoint (see `process_shard`) must exist and mark it done.
+    :param shard_paths: the output files of the shards, in the order of the shards
+    :param output_path: the merged output file
+    """
+    for path in shard_paths:
+        if not os.path.isfile(path):
+            raise ValueError('The output of the shard {0} does not exist!'.format(path))
+        try:
+            with open(path + '.checkpoint', encoding='UTF-8') as infile:
+                done = json.load(infile).get('done')
+        except (OSError, ValueError):
+            done = False
+        if done is not True:
+            raise ValueError('The shard {0} is not finished yet (no finished checkpoint)!'.format(path))
+
+    with open(output_path, 'wb') as outfile:
+        for i, path in enumerate(shard_paths):
+            with open(path, 'rb') as infile:
+                header = infile.readline()
+                if i == 0:
+                    outfile.write(header)
+                shutil.copyfileobj(infile, outfile, 1 << 20)
+
+
+def main():
+    from emphon.stream import add_emphon_args, emphon_kwargs_from_opts
+
+    argparser = argparse.ArgumentParser(
+        description='EmPhon - processing large emtsv files in shards (e.g. on several machines)')
+    subparsers = argparser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    index_parser = subparsers.add_parser('index', help='Build the sentence index of an emtsv file')
+    index_parser.add_argument('-i', '--input', dest='input', required=True, help='The emtsv file')
+    index_parser.add_argument('--index', dest='index', default=None, help='The index file. Default: INPUT.idx')
+    index_parser.add_argument('--shards', dest='shards', type=positive_int, default=None,
+                              help='Print the byte ranges and the number of sentences of this many shards')
+
+    run_parser = subparsers.add_parser('run', help='Process one shard of an emtsv file')
+    run_parser.add_argument('-i', '--input', dest='input', required=True, help='The emtsv file')
+    run_parser.add_argument('-o', '--output', dest='output', required=True, help='The output file of the shard')
+    run_parser.add_argument('--shard', dest='shard', required=True, help='The shard to process in the form k/N')
+    run_parser.add_argument('--index', dest='index', default=None,
+                            help='The index file. Default: INPUT.idx, the file is scanned if it does not exist')
+    run_parser.add_argument('--checkpoint-every', dest='checkpoint_every', type=positive_int, default=1000,
+                            help='The number of sentences between two checkpoints. Default: 1000')
+    run_parser.add_argument('--conllu-comments', dest='conllu_comments', action='store_true',
+                            help='Enable CoNLL-U style comments')
+    add_emphon_args(run_parser)
+
+    merge_parser = subparsers.add_parser('merge', help='Merge the outputs of the shards in order')
+    merge_parser.add_argument('-o', '--output', dest='output', required=True, help='The merged output file')
+    merge_parser.add_argument('shard_outputs', nargs='+', help='The output files of the shards in order')
+
+    opts = argparser.parse_args()
+
+    try:
+        if opts.command == 'index':
+            sentence_index = SentenceIndex.build(opts.input)
+            sentence_index.save(opts.index or index_path(opts.input))
+            print('{0} sentences indexed'.format(len(sentence_index)), file=sys.stderr)
+            if opts.shards is not None:
+                for k, (start, end) in enumerate(sentence_index.shards(opts.shards), start=1):
+                    print('{0}/{1}\t{2}\t{3}\t{4}'.format(k, opts.shards, start, end,
+                                                          bisect_left(sentence_index.offsets, end) -
+                                                          bisect_left(sentence_index.offsets, start)))
+        elif opts.command == 'run':
+            emphon = process_shard(opts.input, opts.output, opts.shard, emphon_kwargs_from_opts(run_parser, opts),
+                                   opts.index, opts.checkpoint_every, opts.conllu_comments)
+            if opts.profile_rules:
+                sys.stderr.write(format_rule_profile(emphon.transcriber.rule_profile()))
+        else:
+            merge_shards(opts.shard_outputs, opts.output)
+    except ValueError as e:
+        argparser.error(str(e))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, vim: expandtab:ts=4 -*-
+
+import sys
+import argparse
+from typing import TextIO
+
+from emphon.argparser import add_bool_arg, positive_int
+from emphon.emphon import EmPhon, OUTPUT_FIELDS
+from emphon.transcriber import format_rule_profile
+from emphon.tsv import read_header, read_sentence_blocks, read_sentences, format_sentence
+
+
+def process_stream(input_stream: TextIO, output_stream: TextIO, emphon_kwargs: dict = None,
+                   block_size: int = 1 << 20, conllu_comments: bool = False, emphon: EmPhon = None) -> EmPhon:
+    """
+    Processes an emtsv stream without the xtsv pipeline: the input is read in large blocks cut at sentence boundaries,
+    the sentences of a block are transcribed in one batch and the output of the block is written at once. In the
+    streaming mode of EmPhon the sentences are read and written one by one, token by token.
+    The output is the same as the output of the xtsv pipeline.
+    :param input_stream: the input stream (including the header)
+    :param output_stream: the output to write to
+    :param emphon_kwargs: the keyword arguments of EmPhon
+    :param block_size: the number of characters read at once
+    :param conllu_comments: whether the `# ` lines before the sentences are comments which are passed through
+    :param emphon: an already created EmPhon instance to use instead of creating one from emphon_kwargs
+    :return: the EmPhon instance used, e.g. to access the statistics of its transcriber
+    """
+    if emphon is None:
+        emphon = EmPhon(**(emphon_kwargs if emphon_kwargs is not None else dict()))
+
+    header, field_names = read_header(iter([input_stream.readline()]), emphon.source_fields)
+    output_stream.write('\t'.join(header + list(emphon.target_fields)) + '\n')
+    field_names = emphon.prepare_fields(field_names)
+
+    if emphon.streaming:
+        # One sentence at a time, its tokens are written as soon as they are processed
+        for comments, sentence in read_sentences(input_stream, conllu_comments):
+            output_stream.writelines(comment + '\n' for comment in comments)
+            output_stream.writelines('\t'.join(token) + '\n' for token in emphon.iter_sentence(sentence, field_names))
+            output_stream.write('\n')
+        return emphon
+
+    for block in read_sentence_blocks(input_stream, block_size, conllu_comments):
+        processed = emphon.process_sentences([sentence for _, sentence in block], field_names)
+        output_stream.write(''.join(format_sentence(comments, sentence)
+                                    for (comments, _), sentence in zip(block, processed)))
+
+    return emphon
+
+
+def add_emphon_args(argparser):
+    """
+    Adds the options of EmPhon and its transcriber to the parser (see `emphon_kwargs_from_opts`)
+    """
+    add_bool_arg(argparser, 'ipaize',
+                 ('Whether the output should be IPA or the emPhon inner representation, '
+                  'which marks one phone with exactly one letter.'), default=True)
+    add_bool_arg(argparser, 'opt-palatal-assim',
+                 'Whether optional palatal assimilation should happen with t/d+ny, e.g. lapátnyél -> lapátynyél',
+                 default=False)
+    add_bool_arg(argparser, 'include-sentence',
+                 'If on, there is a line of comment before the sentence that contains the entire surface form of '
+                 'the sentence.', default=True)
+    add_bool_arg(argparser, 'cache',
+                 'If on, the transcriptions of the recurring segmented words are memoized in a bounded LRU cache.',
+                 default=True)
+    argparser.add_argument('--cache-size', dest='cache_size', type=positive_int, default=65536,
+                           help='The maximal number of memoized word transcriptions. Default: 65536')
+    add_bool_arg(argparser, 'sentence-cache',
+                 'If on, the results of repeated sentences (same form and anas fields) are reused from a bounded '
+                 'LRU cache.', default=False)
+    argparser.add_argument('--sentence-cache-size', dest='sentence_cache_size', type=positive_int, default=4096,
+                           help='The maximal number of memoized sentences. Default: 4096')
+    argparser.add_argument('--outputs', dest='outputs', nargs='+', choices=('inner', 'ipa'), default=None,
+                           help='Produce several output fields from one run of the rules: `inner` (phon_inner) and/or '
+                                '`ipa` (phon) in the given order, overrides --ipaize')
+    argparser.add_argument('--lexicon', dest='lexicon', default=None,
+                           help='A precomputed pronunciation lexicon (built by emphon-lexicon) which is consulted '
+                                'before the rules')
+    argparser.add_argument('--streaming', dest='streaming', action='store_true',
+                           help='Process the sentences token by token in small chunks with bounded memory (for very '
+                                'long sentences, only the single process emphon and emphon-stream)')
+    argparser.add_argument('--vectorized', dest='vectorized', action='store_true',
+                           help='Apply the rules on the batches of distinct words as integer arrays (needs NumPy)')
+    argparser.add_argument('--profile-rules', dest='profile_rules', action='store_true',
+                           help='Print the time, the number of calls and changes of each rule to STDERR at the end '
+                                '(the rules are applied on each transcribed word separately)')
+
+
+def emphon_kwargs_from_opts(argparser, opts) -> dict:
+    """
+    :param argparser: the parser, to report the invalid combinations of the options
+    :param opts: the parsed options (see `add_emphon_args`)
+    :return: the keyword arguments of EmPhon
+    """
+    if opts.outputs is not None and len(set(opts.outputs)) != len(opts.outputs):
+        argparser.error('--outputs must not contain an output twice!')
+
+    if opts.lexicon is not None:
+        # A missing, stale or mismatched lexicon is reported as an error of the options (the rules produce the inner
+        # representation when there are several outputs, see EmPhon)
+        from emphon.lexicon import Lexicon, lexicon_fingerprint
+        try:
+            Lexicon(opts.lexicon, lexicon_fingerprint(opts.ipaize and opts.outputs is None,
+                                                      opts.opt_palatal_assim)).close()
+        except (OSError, ValueError) as e:
+            argparser.error(str(e))
+
+    return {'source_fields': {'form', 'anas'},
+            'target_fields': ['phon'] if opts.outputs is None else
+            [OUTPUT_FIELDS[output] for output in opts.outputs],
+            'outputs': opts.outputs,
+            'include_sentence': opts.include_sentence,
+            'sentence_cache': opts.sentence_cache,
+            'sentence_cache_size': opts.sentence_cache_size,
+            'streaming': opts.streaming,
+            'transcriber_opts': {'ipaize': opts.ipaize,
+                                 'optional_palatal_assimilation': opts.opt_palatal_assim,
+                                 'cache': opts.cache,
+                                 'cache_size': opts.cache_size,
+                                 'profile_rules': opts.profile_rules,
+                                 'lexicon': opts.lexicon,
+                                 'vectorized': opts.vectorized},
+            }
+
+
+def main():
+
+    argparser = argparse.ArgumentParser(
+        description='EmPhon - a phonetic transcriber, lightweight streaming mode without the xtsv pipeline')
+
+    argparser.add_argument('-i', '--input', dest='input_stream', type=argparse.FileType('r', encoding='UTF-8'),
+                           default=sys.stdin, help='Use input file instead of STDIN')
+    argparser.add_argument('-o', '--output', dest='output_stream', type=argparse.FileType('w', encoding='UTF-8'),
+                           default=sys.stdout, help='Use output file instead of STDOUT')
+    argparser.add_argument('--conllu-comments', dest='conllu_comments', action='store_true',
+                           help='Enable CoNLL-U style comments')
+
+    add_emphon_args(argparser)
+    argparser.add_argument('--block-size', dest='block_size', type=positive_int, default=1 << 20,
+                           help='The number of characters read at once. Default: 1048576')
+
+    opts = argparser.parse_args()
+
+    emphon_kwargs = emphon_kwargs_from_opts(argparser, opts)
+
+    emphon = process_stream(opts.input_stream, opts.output_stream, emphon_kwargs, opts.block_size,
+                            opts.conllu_comments)
+
+    if opts.profile_rules:
+        sys.stderr.write(format_rule_profile(emphon.transcriber.rule_profile()))
+
+
+if __name__ == '__main__':
+    main()
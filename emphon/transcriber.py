@@ -1,26 +1,185 @@
-import re
 import json
-import os
-from typing import List
+from collections import namedtuple
+from functools import lru_cache
+from time import perf_counter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from emphon.bundle import compile_pattern, load_ipa_key
+from emphon.lru import CacheInfo, LRUCache
 
 MAIN_POS = {'/V', '/N', '/Adj', '/Adv'}
 
+# The rule cascade is compiled once at import time (or rebuilt from the bundle, see `emphon.bundle`), so per-word work
+# is only the matching itself.
+# The patterns are listed in the order they are applied inside the rule methods of `Transcriber`.
+_X_LETTER = compile_pattern(r'[Xx]')
+_LONG_LETTERS = compile_pattern(r'([bcdfghjklmnpqrstvxzčďǧɲʃťž])\1')
+_STRONGER_LONG_LETTERS = compile_pattern(r'([bcdfghjklmnpqrstvxzčďǧɲʃťž])[|~§#]?\1')
+_DOUBLE_LETTERS = compile_pattern(r'(ccs|ddzs|ddz|ggy|lly|nny|ssz|tty|zzs|cs|dzs|dz|gy|ly|ny|sz|ty|zs)')
+_L_ASSIMILATION = compile_pattern(r'[lL][|§#~]?r')
+_H_FINAL_CH = compile_pattern(r'(ch$)')
+_H_INTERVOCALIC = compile_pattern(r'([aáeéiíoóöőüűuú][|§#~ ]?)h([|§#~ ]?[aáeéiíoóöőüűuú])')
+_H_LONG_INTERVOCALIC = compile_pattern(r'([aáeéiíoóöőüűuú][|§#~ ]?)H([|§#~ ]?[aáeéiíoóöőüűuú])')
+_H_CH = compile_pattern(r'([aáeéiíoóöőüűuú][|§#~]?)[c]h([|§#~]?[bcdfgjklmnpqrstvxzčďǧɲʃťž ]?)')
+_H_AFTER_SONORANT = compile_pattern(r'([mnɲrlj][|§#~]?)h')
+_NASALISATION = compile_pattern(r'n([|~§#]?)([pbfvǧť])')
+_NASALISATION_NY = compile_pattern(r'(n)([|~§#]?ɲ)')
+_N_ASSIMILATION = compile_pattern(r'n[|~§]?([lr])')
+# The sibilant rules are merged into one alternation: their matches cannot overlap (they start with t or d and end
+# with a sibilant), so one scan gives the same result as the rules one after the other
+_SIBILANT = compile_pattern(r't[|~§#]?[ʃs]|t[|~§# ]?[cč]|d[|~§#]?[ʃs]')
+_VOICE_REGRESSIVE_DEVOICING = compile_pattern(r'([bdǧgzžďvĵ])([|~§#]?[ptťkʃscfhč])')
+_VOICE_REGRESSIVE_VOICING = compile_pattern(r'([ptťkʃscfhč])([|~§#]?[bdǧgzžďĵ])')
+_PALATAL_FULL = compile_pattern(r'([ǧdlnɲtť])[|~§#]?j')
+_PALATAL_PARTIAL = compile_pattern(r'[dt][|~§# ]?([ǧť])')
+_PALATAL_OPTIONAL = compile_pattern(r'([dt])[|~§# ]?ɲ')
+_HIATUS_I_VOWEL = compile_pattern(r'i[|~§]?([aáeéoóöőüűuú])')
+_HIATUS_VOWEL_I = compile_pattern(r'([aáeéoóöőüűuú])[|~§]?i')
+_N_NASALIZATION = compile_pattern(r'n[|~§#]?([gk])')
+_DEGEMINATION_LONG_SHORT = compile_pattern(
+    r'([BCDFGHJKLMNPQRSTVWXZČĎǦƝƩŤŽ])([|§~# ]?)([bcdfghjklmnpqrstvwxzčďǧɲʃťž])')
+_DEGEMINATION_SHORT_SHORT_SHORT = compile_pattern(
+    r'([bcdfghjklmnpqrstvwxzčďǧɲʃťž]([bcdfghjklmnpqrstvwxzčďǧɲʃťž]))[|#§~ ]?\2')
+_DEGEMINATION_SHORT_LONG = compile_pattern(
+    r'([bcdfghjklmnpqrstvwxzčďǧɲʃťž])[|~#§]?([BCDFGHJKLMNPQRSTVWXZČĎǦƝƩŤŽ])')
+_DEGEMINATION_CONS_CONS_OBSTRUENT = compile_pattern(
+    r'([bcdfghjklmnpqrstvwxzčďǧɲʃťž])[|~#§ ]?(\1[bcdfghkpqstvwxzčďǧʃťž])')
+_DEGEMINATION_LONG_OBSTRUENT = compile_pattern(r'([BCDFGHJKLMNPQRSTVWXZČĎǦƝƩŤŽ])([bcdfghkpqstvwxzčďǧʃťž])')
+_DEGEMINATION_CONS_CONS_NASAL = compile_pattern(r'([bcdfghjklmnpqrstvwxzčďǧɲʃťž])[|~#§ ]?(\1[mnɲ])')
+_DEGEMINATION_LONG_NASAL = compile_pattern(r'([BCDFGHJKLMNPQRSTVWXZČĎǦƝƩŤŽ])([mnɲ])')
+_M_NASALIZATION = compile_pattern(r'[mn][|#§~ ]?([fv])')
+_BOUNDARIES = compile_pattern(r'[|~§#]')
+# Separates the words of a batch, it is not part of any character class of the rules
+_BATCH_SEPARATOR = '\x1e'
+_MORPHANA_VALUE = compile_pattern(r'"morphana": "((?:[^"\\]|\\.)*)"')
+_MORPHANA_PAIRS = compile_pattern(r"\[(.*?)\]=(.*?)(\+|$)")
+
+# Static replacement tables of the rules
+_NASALISATION_PAIRS = {'p': 'm', 'b': 'm', 'f': 'm', 'v': 'm', 'ǧ': 'ɲ', 'ť': 'ɲ'}
+# voiced = 'bdǧgzžď'
+# voiceless = 'ptťkʃscf'
+_VOICE_PAIRS = {'p': 'b', 'b': 'p', 't': 'd', 'd': 't', 'ť': 'ǧ', 'ǧ': 'ť', 'k': 'g', 'g': 'k', 'f': 'v', 'v': 'f',
+                'ʃ': 'z', 'z': 'ʃ', 's': 'ž', 'ž': 's', 'c': 'ď', 'ď': 'c', 'h': 'ɦ', 'č': 'ĵ', 'ĵ': 'č'}
+_PALATAL_FULL_DICT = {'ǧ': 'Ǧ', 'd': 'Ǧ', 'l': 'J', 'n': 'Ɲ', 'ɲ': 'Ɲ', 't': 'Ť', 'ť': 'Ť'}
+_PALATAL_OPTIONAL_DICT = {'d': 'ǧɲ', 't': 'ťɲ'}
+# The affricate that the sibilant rules produce, by the last character of the match
+_SIBILANT_DICT = {'ʃ': 'C', 's': 'Č', 'c': 'C', 'č': 'Č'}
+_LONG_CONSONANTS = frozenset('BCDFGHJKLMNPQRSTVWXZČĎǦƝƩŤŽ')
+
+# Trigger characters of the rules: a rule cannot change a string that contains none of them. Every rule leaves its
+# result without doubled short consonants (except `w`): it either ends with `_long_letters` when its replacements can
+# bring two identical letters together, or its replacements cannot do that. The rules rely on this for their input
+# too. A space at the end of the string cannot be inside a match. `None` means the rule always runs.
+_RULE_TRIGGERS = {
+    'x_letter': frozenset('xX'),
+    'double_letters': None,
+    'h_transformation': frozenset('hH'),
+    'hiatus_filling': frozenset('i'),
+    'n_nasalization': frozenset('gk'),
+    'l_assimilation': frozenset('rszy'),  # l_assimilation and double_letters
+    'degemination': frozenset('BCDFGHJKLMNPQRSTVWXZČĎǦƝƩŤŽ|~§# w'),
+    'n_assimilation': frozenset('lr'),
+    'palatal_assimilation': frozenset('jǧť'),
+    'm_nasalization': frozenset('fv'),
+    'sibilant_assimilation': frozenset('td'),
+    'voice_assimilation': frozenset('bdǧgzžďvĵ'),
+    'nasalisation': frozenset('n'),
+}
+
+
+RuleStats = namedtuple('RuleStats', ['calls', 'skips', 'changes', 'seconds'])
+
+
+def merge_rule_profiles(profiles: Iterable[Dict[Tuple[str, str], RuleStats]]) -> Dict[Tuple[str, str], RuleStats]:
+    """
+    Sums the statistics of the rules of several transcribers (e.g. of the worker processes)
+    :param profiles: the statistics of the rules
+    :return: the summed statistics
+    """
+    merged = {}
+    for profile in profiles:
+        for key, stats in profile.items():
+            merged[key] = RuleStats(*(a + b for a, b in zip(merged.get(key, (0, 0, 0, 0.0)), stats)))
+    return merged
+
+
+def format_rule_profile(profile: Dict[Tuple[str, str], RuleStats]) -> str:
+    """
+    Formats the statistics of the rules (see `Transcriber.rule_profile`) as a table, the slowest rules first
+    :param profile: the statistics of the rules
+    :return: the table
+    """
+    total = sum(stats.seconds for stats in profile.values()) or 1.0
+    lines = ['{0:<14} {1:<22} {2:>10} {3:>10} {4:>10} {5:>10} {6:>7}'.format(
+        'stage', 'rule', 'calls', 'skips', 'changes', 'seconds', 'share')]
+    for (stage, name), stats in sorted(profile.items(), key=lambda item: item[1].seconds, reverse=True):
+        lines.append('{0:<14} {1:<22} {2:>10} {3:>10} {4:>10} {5:>10.4f} {6:>7.1%}'.format(
+            stage, name, stats.calls, stats.skips, stats.changes, stats.seconds, stats.seconds / total))
+    return '\n'.join(lines) + '\n'
+
+
+def _upper_first(m) -> str:
+    return m.group(1).upper()
+
+
+def _lower_first(m) -> str:
+    return m.group(1).lower() + m.group(2)
+
+
+def _lower_second(m) -> str:
+    return m.group(1) + m.group(2).lower()
+
+
+def _nasalise(m) -> str:
+    return _NASALISATION_PAIRS[m.group(2)] + m.group(1) + m.group(2)
+
+
+def _switch_voice(m) -> str:
+    return _VOICE_PAIRS[m.group(1)] + m.group(2)
+
+
+def _full_palatal(m) -> str:
+    return _PALATAL_FULL_DICT[m.group(1)]
+
+
+def _optional_palatal(m) -> str:
+    return _PALATAL_OPTIONAL_DICT[m.group(1)]
+
+
+def _sibilant(m) -> str:
+    return _SIBILANT_DICT[m.group()[-1]]
+
+
+def _lower_first_keep_boundary(m) -> str:
+    return m.group(1).lower() + m.group(2) + m.group(3)
+
 
 class Transcriber:
     """
     Phonetic transcriber class. Examples are commented after the rules to ease the reading of regexes.
     """
-    def __init__(self, ipaize: bool = True, optional_palatal_assimilation: bool = False):
+    def __init__(self, ipaize: bool = True, optional_palatal_assimilation: bool = False, cache: bool = True,
+                 cache_size: int = 65536, profile_rules: bool = False, lexicon: str = None, vectorized: bool = False):
         """
         :param ipaize: whether the output uses the inner representation or the IPA form
         :param optional_palatal_assimilation: optional palatal assimilation in cases like `lapátnyél`
+        :param cache: whether the transcriptions of the segmented words are memoized
+        :param cache_size: the maximal number of memoized transcriptions, the least recently used one is evicted
+        :param profile_rules: record the time, the number of calls and changes of each rule (see `rule_profile`)
+        :param lexicon: the path of a precomputed lexicon (see `emphon.lexicon`) which is consulted before the rules
+        :param vectorized: `transcribe_batch` applies the rules on an integer array of the batch with NumPy
+         (see `emphon.vectorized`), the rules are not profiled there
         """
+        if cache_size < 1:
+            raise ValueError('cache_size must be positive, use cache=False to disable the cache!')
+
         self.optional_palatal_assimilation = optional_palatal_assimilation
 
         self.ipaize = ipaize
-        if self.ipaize:
-            with open(os.path.join(os.path.dirname(__file__), 'ipa_key.json')) as infile:
-                self.ipa_key = json.load(infile)
+        # The IPA key is loaded regardless of ipaize as `ipaization` can convert the inner representation on its own
+        self.ipa_key = load_ipa_key()
+        # Only the one-letter keys can match as the conversion goes letter by letter
+        self._ipa_table = str.maketrans({letter: ipa for letter, ipa in self.ipa_key.items() if len(letter) == 1})
 
         self.double_letter_vocab = {
             'ccs': 'Č',
@@ -42,110 +201,292 @@ class Transcriber:
             'ty': 'ť',
             'zs': 'ž'}
 
+        double_letter_vocab = self.double_letter_vocab
+        self._double_letter_repl = lambda m: double_letter_vocab[m.group(1)]
+
+        # The bound rule methods in the order of application with their trigger characters, resolved once
+        triggers = dict(_RULE_TRIGGERS)
+        if self.optional_palatal_assimilation:
+            triggers['palatal_assimilation'] = triggers['palatal_assimilation'] | {'ɲ'}
+        self._preprocessing = tuple((name, getattr(self, name), triggers[name]) for name in
+                                    ('x_letter', 'double_letters', 'h_transformation', 'hiatus_filling'))
+        self._pass_rules = tuple((name, getattr(self, name), triggers[name]) for name in
+                                 ('n_nasalization', 'l_assimilation', 'degemination', 'n_assimilation',
+                                  'palatal_assimilation', 'm_nasalization', 'sibilant_assimilation',
+                                  'voice_assimilation', 'nasalisation'))
+
+        self.cache = cache
+        self.cache_size = cache_size
+        self._cache = LRUCache(cache_size)
+
+        # (stage, rule name) -> [calls, skips, changes, seconds], None when the profiling is off
+        self._rule_profile = {} if profile_rules else None
+
+        self.lexicon = None
+        if lexicon is not None:
+            from emphon.lexicon import Lexicon, lexicon_fingerprint
+            self.lexicon = Lexicon(lexicon, lexicon_fingerprint(self.ipaize, self.optional_palatal_assimilation))
+
+        self._vector_transcriber = None
+        if vectorized:
+            from emphon.vectorized import VectorTranscriber
+            self._vector_transcriber = VectorTranscriber(self.ipaize, self.optional_palatal_assimilation)
+
     def __call__(self, sentence: str, passes=2) -> str:
         """
         Processes the incoming strings. Does `passes` passes so that a rule can feed into another rule.
+        The results are memoized in a bounded LRU cache (if enabled), as running text is highly repetitive.
         :param sentence: the sentence to process
         :param passes: the number of passes sentence goes under
         :return: the processed sentence
         """
-        sentence = self.x_letter(sentence)
-        sentence = self.double_letters(sentence)
-        sentence = self.h_transformation(sentence)
-        sentence = self.hiatus_filling(sentence)
+        if not self.cache:
+            return self._lookup_or_transcribe(sentence, passes)
+
+        key = (sentence, self.ipaize, self.optional_palatal_assimilation, passes)
+        result = self._cache.get(key)
+        if result is None:
+            result = self._lookup_or_transcribe(sentence, passes)
+            self._cache.put(key, result)
+        return result
+
+    def _lookup_or_transcribe(self, sentence: str, passes: int) -> str:
+        if self.lexicon is not None and passes == self.lexicon.passes:
+            result = self.lexicon.get(sentence)
+            if result is not None:
+                return result
+        return self.transcribe(sentence, passes)
+
+    def transcribe_batch(self, words: List[str], passes=2) -> List[str]:
+        """
+        Processes many strings at once: the (uncached, distinct) words are joined by a separator which no rule can
+        match or cross, every rule is applied once on the joined string and the result is split back.
+        The results are identical to calling the transcriber on each word. In the profiling mode the words are
+        processed one by one, so the statistics of the rules count words regardless of the size of the batches.
+        :param words: the words to process
+        :param passes: the number of passes the words go under
+        :return: the processed words in the order of the input
+        """
+        results = [None] * len(words)
+        pending = {}  # Word -> indices of its occurrences
+        for i, word in enumerate(words):
+            if word in pending:
+                pending[word].append(i)
+                if self.cache:
+                    self._cache.hits += 1
+                continue
+            if self.cache:
+                result = self._cache.get((word, self.ipaize, self.optional_palatal_assimilation, passes))
+                if result is not None:
+                    results[i] = result
+                    continue
+            pending[word] = [i]
+
+        found = {}
+        if self.lexicon is not None and passes == self.lexicon.passes:
+            for word in pending:
+                result = self.lexicon.get(word)
+                if result is not None:
+                    found[word] = result
+
+        # `ch$` could not match at the end of a word inside the batch, these words are processed one by one
+        batch = [word for word in pending if word not in found and _BATCH_SEPARATOR not in word and
+                 not word.rstrip('\n').endswith('ch')]
+        if not batch or self._rule_profile is not None:  # The rules are profiled on each word (independent of batching)
+            transcriptions = {}
+        elif self._vector_transcriber is not None:
+            transcriptions = dict(zip(batch, self._vector_transcriber.transcribe_batch(batch, passes)))
+        else:
+            transcriptions = dict(zip(batch, self.transcribe(_BATCH_SEPARATOR.join(batch), passes).split(
+                _BATCH_SEPARATOR)))
+        transcriptions.update(found)
+
+        for word, indices in pending.items():
+            result = transcriptions.get(word)
+            if result is None:  # The word is left out of the batch
+                result = self.transcribe(word, passes)
+            if self.cache:
+                self._cache.put((word, self.ipaize, self.optional_palatal_assimilation, passes), result)
+            for i in indices:
+                results[i] = result
+
+        return results
+
+    def cache_info(self) -> CacheInfo:
+        """
+        Statistics of the transcription cache in the style of `functools.lru_cache`
+        :return: the number of hits, misses and evictions, the maximal and the current size of the cache
+        """
+        return self._cache.info()
 
-        for _ in range(passes):
+    def cache_clear(self):
+        """
+        Empties the transcription cache and resets its statistics
+        """
+        self._cache.clear()
+
+    def transcribe(self, sentence: str, passes=2) -> str:
+        """
+        Runs the rule cascade on the incoming string without consulting the cache.
+        Rules without their trigger characters in the string are skipped and the passes stop early (at most `passes`
+        passes are done) when a pass does not change the string as every further pass would be the same.
+        :param sentence: the sentence to process
+        :param passes: the maximal number of passes sentence goes under
+        :return: the processed sentence
+        """
+        if self._rule_profile is not None:
+            return self._transcribe_profiled(sentence, passes)
+
+        chars = set(sentence.rstrip(' '))
+        for _, rule, triggers in self._preprocessing:
+            if triggers is None or not triggers.isdisjoint(chars):
+                new_sentence = rule(sentence)
+                if new_sentence != sentence:
+                    sentence = new_sentence
+                    chars = set(sentence.rstrip(' '))
 
-            sentence = self.n_nasalization(sentence)
-            sentence = self.l_assimilation(sentence)
-            sentence = self.degemination(sentence)
-            sentence = self.n_assimilation(sentence)
-            sentence = self.palatal_assimilation(sentence)
-            sentence = self.m_nasalization(sentence)
-            sentence = self.sibilant_assimilation(sentence)
-            sentence = self.voice_assimilation(sentence)
-            sentence = self.nasalisation(sentence)
+        for _ in range(passes):
+            pass_input = sentence
+            for _, rule, triggers in self._pass_rules:
+                if not triggers.isdisjoint(chars):
+                    new_sentence = rule(sentence)
+                    if new_sentence != sentence:
+                        sentence = new_sentence
+                        chars = set(sentence.rstrip(' '))
+            if sentence == pass_input:
+                break
 
         if self.ipaize:
             return self.ipaization(sentence)
         else:
             return sentence
 
+    def _transcribe_profiled(self, sentence: str, passes=2) -> str:
+        """
+        The same as `transcribe`, but records the statistics of each rule application per stage
+        """
+        profile = self._rule_profile
+
+        def apply(stage, name, rule, triggers, sentence, chars):
+            stats = profile.setdefault((stage, name), [0, 0, 0, 0.0])
+            if triggers is not None and triggers.isdisjoint(chars):
+                stats[1] += 1
+                return sentence, chars
+            start = perf_counter()
+            new_sentence = rule(sentence)
+            stats[3] += perf_counter() - start
+            stats[0] += 1
+            if new_sentence != sentence:
+                stats[2] += 1
+                return new_sentence, set(new_sentence.rstrip(' '))
+            return sentence, chars
+
+        chars = set(sentence.rstrip(' '))
+        for name, rule, triggers in self._preprocessing:
+            sentence, chars = apply('preprocessing', name, rule, triggers, sentence, chars)
+
+        for i in range(passes):
+            pass_input = sentence
+            for name, rule, triggers in self._pass_rules:
+                sentence, chars = apply('pass {0}'.format(i + 1), name, rule, triggers, sentence, chars)
+            if sentence == pass_input:
+                break
+
+        if self.ipaize:
+            sentence, _ = apply('ipaization', 'ipaization', self.ipaization, None, sentence, chars)
+        return sentence
+
+    def rule_profile(self) -> Dict[Tuple[str, str], RuleStats]:
+        """
+        The statistics of the rules recorded in the profiling mode (`profile_rules=True`)
+        :return: (stage, rule name) -> the number of calls, skips (no trigger character), changes and the cumulative
+         time of the rule, the stages are `preprocessing`, `pass 1`, `pass 2`, ... and `ipaization`
+        """
+        if self._rule_profile is None:
+            return {}
+        return {key: RuleStats(*stats) for key, stats in self._rule_profile.items()}
+
+    def reset_rule_profile(self):
+        """
+        Clears the statistics of the rules
+        """
+        if self._rule_profile is not None:
+            self._rule_profile.clear()
+
     @staticmethod
     def x_letter(sentence: str) -> str:
-        return re.sub(r'[Xx]', 'ksz', sentence)
+        return _X_LETTER.sub('ksz', sentence)
 
     @staticmethod
     def _long_letters(sentence: str) -> str:
-        sentence = re.sub(r'([bcdfghjklmnpqrstvxzčďǧɲʃťž])\1',
-                          lambda m: m.group(1).upper(), sentence)
+        sentence = _LONG_LETTERS.sub(_upper_first, sentence)
         return sentence
 
     @staticmethod
     def _stronger_long_letters(sentence: str) -> str:
-        sentence = re.sub(r'([bcdfghjklmnpqrstvxzčďǧɲʃťž])[|~§#]?\1',
-                          lambda m: m.group(1).upper(), sentence)
+        sentence = _STRONGER_LONG_LETTERS.sub(_upper_first, sentence)
         return sentence
 
     def double_letters(self, sentence: str) -> str:
 
-        sentence = re.sub(r'(ccs|ddzs|ddz|ggy|lly|nny|ssz|tty|zzs|cs|dzs|dz|gy|ly|ny|sz|ty|zs)',
-                          lambda m: self.double_letter_vocab[m.group(1)], sentence)
+        sentence = _DOUBLE_LETTERS.sub(self._double_letter_repl, sentence)
 
         sentence = self._long_letters(sentence)
 
         return sentence
 
+    def _changed_double_letters(self, sentence: str) -> str:
+        # The input of the rule contains no doubled letters, so they can only come from the digraphs replaced here
+        sentence, changes = _DOUBLE_LETTERS.subn(self._double_letter_repl, sentence)
+        if changes:
+            sentence = self._long_letters(sentence)
+        return sentence
+
     def l_assimilation(self, sentence: str) -> str:
-        sentence = re.sub(r'[lL][|§#~]?r', r'R', sentence)  # balra
-        return self.double_letters(sentence)
+        sentence = _L_ASSIMILATION.sub('R', sentence)  # balra
+        return self._changed_double_letters(sentence)
 
     def h_transformation(self, sentence: str) -> str:
-        sentence = re.sub(r'(ch$)', r'Ḧ', sentence)
-        sentence = re.sub(
-            r'([aáeéiíoóöőüűuú][|§#~ ]?)h([|§#~ ]?[aáeéiíoóöőüűuú])', r'\g<1>ɦ\g<2>', sentence)  # tehén
-        sentence = re.sub(
-            r'([aáeéiíoóöőüűuú][|§#~ ]?)H([|§#~ ]?[aáeéiíoóöőüűuú])', r'\g<1>Ḧ\g<2>', sentence)  # ahhoz
-        sentence = re.sub(
-            r'([aáeéiíoóöőüűuú][|§#~]?)[c]h([|§#~]?[bcdfgjklmnpqrstvxzčďǧɲʃťž ]?)', r'\g<1>ḧ\g<2>', sentence)  # pechből
-        sentence = re.sub(r'([mnɲrlj][|§#~]?)h', r'\g<1>ɦ', sentence)
+        # None of the replacements can create doubled letters, hence no `_long_letters` here
+        if 'ch' in sentence:
+            sentence = _H_FINAL_CH.sub('Ḧ', sentence)
+        if 'h' in sentence:
+            sentence = _H_INTERVOCALIC.sub(r'\g<1>ɦ\g<2>', sentence)  # tehén
+        if 'H' in sentence:
+            sentence = _H_LONG_INTERVOCALIC.sub(r'\g<1>Ḧ\g<2>', sentence)  # ahhoz
+        if 'ch' in sentence:
+            sentence = _H_CH.sub(r'\g<1>ḧ\g<2>', sentence)  # pechből
+        if 'h' in sentence:
+            sentence = _H_AFTER_SONORANT.sub(r'\g<1>ɦ', sentence)
 
-        return self._long_letters(sentence)
+        return sentence
 
     def nasalisation(self, sentence: str) -> str:
-        pairs = {'p': 'm', 'b': 'm', 'f': 'm', 'v': 'm', 'ǧ': 'ɲ', 'ť': 'ɲ'}
-        sentence = re.sub(r'n([|~§#]?)([pbfvǧť])', lambda m: pairs[m.group(
-            2)]+m.group(1)+m.group(2), sentence)  # tanpálya
-        sentence = re.sub(r'(n)([|~§#]?ɲ)', r'Ɲ', sentence)  # lennyakkendő
-        return self._long_letters(sentence)
+        sentence, changes = _NASALISATION.subn(_nasalise, sentence)  # tanpálya
+        if 'ɲ' in sentence:
+            sentence = _NASALISATION_NY.sub('Ɲ', sentence)  # lennyakkendő
+        if changes:  # Only the first rule can create doubled letters (mnb -> mmb)
+            sentence = self._long_letters(sentence)
+        return sentence
 
     def n_assimilation(self, sentence: str) -> str:
-        sentence = re.sub(r'n[|~§]?([lr])',
-                          lambda m: m.group(1).upper(), sentence)  # hasonló
-        return self._long_letters(sentence)
+        # The result is a long consonant, which cannot form doubled letters, hence no `_long_letters` here
+        return _N_ASSIMILATION.sub(_upper_first, sentence)  # hasonló
 
     def sibilant_assimilation(self, sentence: str) -> str:
-        sentence = re.sub(r'(t)([|~§#]?ʃ)', r'C', sentence)  # hatszög
-        sentence = re.sub(r'(t)([|~§#]?s)', r'Č', sentence)  # hátság
-        sentence = re.sub(r'(t)([|~§# ]?c)', r'C', sentence)  # hét cica
-        sentence = re.sub(r'(t)([|~§# ]?č)', r'Č', sentence)  # hat csap
-        sentence = re.sub(r'(d)([|~§#]?ʃ)', r'C', sentence)  # rendszer
-        sentence = re.sub(r'(d)([|~§#]?s)', r'Č', sentence)  # hadsereg
-        return self._long_letters(sentence)
+        # hatszög, hátság, hét cica, hat csap, rendszer, hadsereg
+        # The result is an affricate written in upper case, which cannot form doubled letters
+        return _SIBILANT.sub(_sibilant, sentence)
 
     def voice_assimilation(self, sentence: str) -> str:
-        # voiced = 'bdǧgzžď'
-        # voiceless = 'ptťkʃscf'
-        pairs = {'p': 'b', 'b': 'p', 't': 'd', 'd': 't', 'ť': 'ǧ', 'ǧ': 'ť', 'k': 'g', 'g': 'k', 'f': 'v', 'v': 'f',
-                 'ʃ': 'z', 'z': 'ʃ', 's': 'ž', 'ž': 's', 'c': 'ď', 'ď': 'c', 'h': 'ɦ', 'č': 'ĵ', 'ĵ': 'č'}
-
-        sentence = re.sub(r'([bdǧgzžďvĵ])([|~§#]?[ptťkʃscfhč])',
-                          lambda m: pairs[m.group(1)]+m.group(2), sentence)  # útpadka -> útpatka
+        # The two rules can not be merged: devoicing can produce the context of voicing (bkd -> pkd -> pgd)
+        sentence, devoiced = _VOICE_REGRESSIVE_DEVOICING.subn(_switch_voice, sentence)  # útpadka -> útpatka
 
-        sentence = re.sub(r'([ptťkʃscfhč])([|~§#]?[bdǧgzžďĵ])',
-                          lambda m: pairs[m.group(1)]+m.group(2), sentence)  # habfürdő -> hapfürdő
+        sentence, voiced = _VOICE_REGRESSIVE_VOICING.subn(_switch_voice, sentence)  # habfürdő -> hapfürdő
 
-        return self._long_letters(sentence)
+        if devoiced or voiced:
+            sentence = self._long_letters(sentence)
+        return sentence
 
     def palatal_assimilation(self, sentence: str) -> str:
         # Rules in human-readable form
@@ -161,32 +502,30 @@ class Transcriber:
         #            ('d', 'ť', 'Ť'), ('t', 'ť', 'Ť')]
         # optional = [('d', 'ɲ', 'ǧɲ'), ('t', 'ɲ', 'ťɲ')]
 
-        full_dict = {'ǧ': 'Ǧ', 'd': 'Ǧ', 'l': 'J',
-                     'n': 'Ɲ', 'ɲ': 'Ɲ', 't': 'Ť', 'ť': 'Ť'}
-        # partial is [dt][ǧť] and the second is upper
-        optional_dict = {'d': 'ǧɲ', 't': 'ťɲ'}
-
-        sentence = re.sub(r'([ǧdlnɲtť])[|~§#]?j',
-                          lambda m: full_dict[m.group(1)], sentence)  # hagyjál
+        # The full and partial rules result in long consonants, only the optional one can create doubled letters
+        if 'j' in sentence:
+            sentence = _PALATAL_FULL.sub(_full_palatal, sentence)  # hagyjál
 
-        sentence = re.sub(r'[dt][|~§# ]?([ǧť])',
-                          lambda m: m.group(1).upper(), sentence)  # hét tyúk
+        # partial is [dt][ǧť] and the second is upper
+        if 'ǧ' in sentence or 'ť' in sentence:
+            sentence = _PALATAL_PARTIAL.sub(_upper_first, sentence)  # hét tyúk
 
-        if self.optional_palatal_assimilation:
-            sentence = re.sub(r'([dt])[|~§# ]?ɲ',
-                              lambda m: optional_dict[m.group(1)], sentence)  # lapátnyél
+        if self.optional_palatal_assimilation and 'ɲ' in sentence:
+            sentence, changes = _PALATAL_OPTIONAL.subn(_optional_palatal, sentence)  # lapátnyél
+            if changes:
+                sentence = self._long_letters(sentence)
 
-        return self._long_letters(sentence)
+        return sentence
 
     @staticmethod
     def hiatus_filling(sentence: str) -> str:
-        sentence = re.sub(r'i[|~§]?([aáeéoóöőüűuú])', r'ij\g<1>', sentence)
-        sentence = re.sub(r'([aáeéoóöőüűuú])[|~§]?i', r'\g<1>ji', sentence)
+        sentence = _HIATUS_I_VOWEL.sub(r'ij\g<1>', sentence)
+        sentence = _HIATUS_VOWEL_I.sub(r'\g<1>ji', sentence)
         return sentence
 
     def n_nasalization(self, sentence: str) -> str:
-        sentence = re.sub(r'n[|~§#]?([gk])', r'ŋ\g<1>', sentence)
-        return self.double_letters(sentence)
+        sentence = _N_NASALIZATION.sub(r'ŋ\g<1>', sentence)
+        return self._changed_double_letters(sentence)
 
     def degemination(self, sentence: str) -> str:
         # These are left here intentionally, for reference.
@@ -196,43 +535,56 @@ class Transcriber:
         # nasal = 'mnɲ'
         # obstruents = 'bcdfghkpqstvwxzčďǧʃťž'
 
+        # The rules depend on each other, so they run one after the other, but the rules of long consonants are
+        # skipped when there are none (the rules only shorten long consonants, they never create them)
+        has_long = not _LONG_CONSONANTS.isdisjoint(sentence)
+        changes = 0
+
         # short consonant after long consonant
-        sentence = re.sub(r'([BCDFGHJKLMNPQRSTVWXZČĎǦƝƩŤŽ])([|§~# ]?)([bcdfghjklmnpqrstvwxzčďǧɲʃťž])',
-                          lambda m: m.group(1).lower()+m.group(2)+m.group(3), sentence)  # Ludd tábornok
+        if has_long:
+            sentence, n = _DEGEMINATION_LONG_SHORT.subn(_lower_first_keep_boundary, sentence)  # Ludd tábornok
+            changes += n
 
         # short#1 short#2 short#2
-        sentence = re.sub(r'([bcdfghjklmnpqrstvwxzčďǧɲʃťž]([bcdfghjklmnpqrstvwxzčďǧɲʃťž]))[|#§~ ]?\2',
-                          r'\g<1>', sentence)  # Ford dísztárcsa
+        sentence, n = _DEGEMINATION_SHORT_SHORT_SHORT.subn(r'\g<1>', sentence)  # Ford dísztárcsa
+        changes += n
 
         # short long
-        sentence = re.sub(r'([bcdfghjklmnpqrstvwxzčďǧɲʃťž])[|~#§]?([BCDFGHJKLMNPQRSTVWXZČĎǦƝƩŤŽ])',
-                          lambda m: m.group(1)+m.group(2).lower(), sentence)  #
+        if has_long:
+            sentence, n = _DEGEMINATION_SHORT_LONG.subn(_lower_second, sentence)  #
+            changes += n
 
         # cons#1 cons#1 obstruent
-        sentence = re.sub(
-            r'([bcdfghjklmnpqrstvwxzčďǧɲʃťž])[|~#§ ]?(\1[bcdfghkpqstvwxzčďǧʃťž])', r'\g<2>', sentence)
+        sentence, n = _DEGEMINATION_CONS_CONS_OBSTRUENT.subn(r'\g<2>', sentence)
+        changes += n
 
         # long cons obstruent
-        sentence = re.sub(r'([BCDFGHJKLMNPQRSTVWXZČĎǦƝƩŤŽ])([bcdfghkpqstvwxzčďǧʃťž])',
-                          lambda m: m.group(1).lower()+m.group(2), sentence)
+        if has_long:
+            sentence, n = _DEGEMINATION_LONG_OBSTRUENT.subn(_lower_first, sentence)
+            changes += n
 
         # cons cons nasal
-        sentence = re.sub(
-            r'([bcdfghjklmnpqrstvwxzčďǧɲʃťž])[|~#§ ]?(\1[mnɲ])', r'\g<2>', sentence)  # optional
+        sentence, n = _DEGEMINATION_CONS_CONS_NASAL.subn(r'\g<2>', sentence)  # optional
+        changes += n
 
         # long cons nasal
-        sentence = re.sub(r'([BCDFGHJKLMNPQRSTVWXZČĎǦƝƩŤŽ])([mnɲ])', lambda m: m.group(
-            1).lower()+m.group(2), sentence)
+        if has_long:
+            sentence, n = _DEGEMINATION_LONG_NASAL.subn(_lower_first, sentence)
+            changes += n
 
-        return self._long_letters(sentence)
+        if changes:
+            sentence = self._long_letters(sentence)
+        return sentence
 
     def m_nasalization(self, sentence: str) -> str:
-        sentence = re.sub(r'[mn][|#§~ ]?([fv])', r'ɱ\g<1>', sentence)  # kámfor
-        return self._long_letters(sentence)
+        # ɱ cannot form doubled letters, hence no `_long_letters` here
+        return _M_NASALIZATION.sub(r'ɱ\g<1>', sentence)  # kámfor
 
     def ipaization(self, sentence: str) -> str:
-        sentence = self._long_letters(re.sub(r'[|~§#]', '', sentence))
-        ipa_sentence = ''.join(self.ipa_key.get(letter, letter) for letter in sentence)
+        sentence, changes = _BOUNDARIES.subn('', sentence)
+        if changes:  # Removing the boundaries can bring together two identical letters
+            sentence = self._long_letters(sentence)
+        ipa_sentence = sentence.translate(self._ipa_table)
         return ipa_sentence
 
     @staticmethod
@@ -241,55 +593,91 @@ class Transcriber:
         Segment words based on morphological analysis. It uses the field `anas`, which contains the output of emMorph
         with the possible segmentation. Selects the longest analysis (which is supposedly the finest), then adds
         delimiters based on the morph boundaries. In case of no analysis, it assumes that the token is a single morph.
+        The segmentation is memoized on the raw `anas` string as the same analyses recur throughout a corpus.
         :param sentence: xtsv sentence with `form` and `morph` fields
         :param field_names: field names
         :return: list of segmented words
         """
-        new_sentence = []
+        return list(Transcriber.iter_segment(sentence, field_names))
+
+    @staticmethod
+    def iter_segment(sentence: Iterable[List[str]], field_names: dict) -> Iterator[str]:
+        """
+        Generator form of `segment`, the words are segmented one by one
+        :param sentence: xtsv sentence (or any iterable of its tokens) with `form` and `morph` fields
+        :param field_names: field names
+        :return: the segmented words
+        """
+        anas_field, form_field = field_names['anas'], field_names['form']
 
         for line in sentence:
-            anas = json.loads(line[field_names['anas']])
-            #  we suppose that the longest morphana is the finest
-            anas_sorted = [ana['morphana']
-                           for ana in sorted(anas, key=lambda s: s['morphana'].count('+'), reverse=True)]
+            word = _segment_anas(line[anas_field])
             #  in case it is a symbol or some other weird thing the morphana is empty
-            if anas_sorted == [] or anas_sorted == ['']:
-                new_sentence.append(line[field_names['form']].lower() + ' ')
+            if word is None:
+                yield line[form_field].lower() + ' '
             else:
-                #  the regex finds tag-surface realization pairs
-                tags, morphs, _ = zip(*re.findall(r"\[(.*?)\]=(.*?)(\+|$)", anas_sorted[0]))
-                morphs = [x.lower() for x in morphs]
-                #  in some special cases like adverbs, punctiations there is only one morph and we have to consider it #
-                #  a special case
-                if len(morphs) == 1:
-                    new_sentence.append(morphs[0] + ' ')
-                else:
-                    word = []
-                    is_end_of_main = False
-                    #  we iterate over the morphs and make 4 distinct categories:
-                    #  before root, between roots, after root, between suffixes
-                    #  we mark these by | # § ~
-                    #  and for the empty morphs in the Hungarian at the end of words (Nom), we discard it
-                    for i, morph in enumerate(morphs[:-1]):
-                        word.append(morph)
-                        if morphs[i+1] == '':
-                            continue  # to avoid empty | in the end
-                        curr_is_lemma, next_is_lemma = tags[i] in MAIN_POS, tags[i+1] in MAIN_POS
-                        if is_end_of_main:
-                            word.append('|')
-                        elif curr_is_lemma and next_is_lemma:
-                            word.append('#')
-                        elif not curr_is_lemma and next_is_lemma:
-                            word.append('§')
-                        elif curr_is_lemma and not next_is_lemma:
-                            word.append('~')
-                            is_end_of_main = True
-                        elif not curr_is_lemma and not next_is_lemma:
-                            word.append('|')
-                    else:
-                        if morphs[-1] != '':  # empty morphemes at the end (nominative suffix) have to be discarded
-                            word.append(morphs[-1])
-
-                    new_sentence.append(''.join(word + [' ']))
-
-        return new_sentence
+                yield word
+
+
+def _morphanas(anas: str) -> List[str]:
+    """
+    Extracts the `morphana` values from the JSON list of the analyses without decoding the unused fields.
+    Falls back to JSON decoding when the fast path cannot be used.
+    :param anas: the raw `anas` field
+    :return: the list of morphanas in the order of the analyses
+    """
+    morphanas = _MORPHANA_VALUE.findall(anas)
+    #  unusual formatting (e.g. no space after the colon) is left to the JSON decoder
+    if len(morphanas) != anas.count('"morphana"') or (not morphanas and anas != '[]'):
+        return [ana['morphana'] for ana in json.loads(anas)]
+    return [json.loads('"' + morphana + '"') if '\\' in morphana else morphana for morphana in morphanas]
+
+
+@lru_cache(maxsize=65536)
+def _segment_anas(anas: str) -> Optional[str]:
+    """
+    Segments the word by its longest analysis
+    :param anas: the raw `anas` field
+    :return: the segmented word or None if the token has no (non-empty) analysis
+    """
+    morphanas = _morphanas(anas)
+    #  we suppose that the longest morphana is the finest, the first one is selected among the equally long ones
+    if morphanas == [] or morphanas == ['']:
+        return None
+
+    best = max(morphanas, key=lambda s: s.count('+'))
+    #  the regex finds tag-surface realization pairs
+    tags, morphs, _ = zip(*_MORPHANA_PAIRS.findall(best))
+    morphs = [x.lower() for x in morphs]
+    #  in some special cases like adverbs, punctiations there is only one morph and we have to consider it #
+    #  a special case
+    if len(morphs) == 1:
+        return morphs[0] + ' '
+
+    word = []
+    is_end_of_main = False
+    #  we iterate over the morphs and make 4 distinct categories:
+    #  before root, between roots, after root, between suffixes
+    #  we mark these by | # § ~
+    #  and for the empty morphs in the Hungarian at the end of words (Nom), we discard it
+    for i, morph in enumerate(morphs[:-1]):
+        word.append(morph)
+        if morphs[i+1] == '':
+            continue  # to avoid empty | in the end
+        curr_is_lemma, next_is_lemma = tags[i] in MAIN_POS, tags[i+1] in MAIN_POS
+        if is_end_of_main:
+            word.append('|')
+        elif curr_is_lemma and next_is_lemma:
+            word.append('#')
+        elif not curr_is_lemma and next_is_lemma:
+            word.append('§')
+        elif curr_is_lemma and not next_is_lemma:
+            word.append('~')
+            is_end_of_main = True
+        elif not curr_is_lemma and not next_is_lemma:
+            word.append('|')
+    else:
+        if morphs[-1] != '':  # empty morphemes at the end (nominative suffix) have to be discarded
+            word.append(morphs[-1])
+
+    return ''.join(word + [' '])
@@ -0,0 +1,114 @@
+from typing import Iterable, Iterator, List, TextIO, Tuple
+
+
+def read_header(lines: Iterator[str], source_fields: set) -> Tuple[List[str], dict]:
+    """
+    Reads the header of the emtsv stream and checks whether the source fields are present
+    :param lines: the iterator of the input lines
+    :param source_fields: the fields which are needed by the module
+    :return: the list of the field names and the field name -> column number mapping (as xtsv does)
+    """
+    header = next(lines, '').rstrip('\n').split('\t')
+    field_names = {field: i for i, field in enumerate(header)}
+    missing = set(source_fields) - field_names.keys()
+    if missing:
+        raise ValueError('Input does not have the required field names ({0}). The following field names found: {1}'.
+                         format(sorted(missing), header))
+    return header, field_names
+
+
+def read_sentences(lines: Iterable[str], conllu_comments: bool = False) \
+        -> Iterator[Tuple[List[str], List[List[str]]]]:
+    """
+    Groups the lines (after the header) into sentences which are separated by empty lines as xtsv does: a comment is
+    a line starting with `# ` before the first token of the sentence (a later one is a token) and the comments
+    followed by an empty line belong to the next sentence
+    :param lines: the input lines
+    :param conllu_comments: whether there are comments (as in the CoNLL-U format)
+    :return: the comment lines and the tokens (as the list of fields) of each sentence
+    """
+    comments, sentence = [], []
+    for line in lines:
+        line = line.rstrip('\n')
+        if len(line) == 0:
+            if len(sentence) > 0:
+                yield comments, sentence
+                comments, sentence = [], []
+        elif conllu_comments and len(sentence) == 0 and line.startswith('# '):
+            comments.append(line)
+        else:
+            sentence.append(line.split('\t'))
+
+    if len(sentence) > 0:
+        yield comments, sentence
+
+
+def format_sentence(comments: List[str], sentence: List[List[str]]) -> str:
+    """
+    Formats an (already processed) sentence with its comment lines and the closing empty line
+    :param comments: the comment lines of the sentence
+    :param sentence: the tokens of the sentence
+    :return: the lines of the sentence as one string
+    """
+    lines = [comment + '\n' for comment in comments]
+    lines.extend('\t'.join(token) + '\n' for token in sentence)
+    lines.append('\n')
+    return ''.join(lines)
+
+
+def read_sentence_blocks(stream: TextIO, block_size: int = 1 << 20, conllu_comments: bool = False) \
+        -> Iterator[List[Tuple[List[str], List[List[str]]]]]:
+    """
+    Reads the stream (after the header) in large blocks which are cut at sentence boundaries (empty lines)
+    :param stream: the input stream
+    :param block_size: the number of characters read at once
+    :param conllu_comments: whether there are comments (as in the CoNLL-U format, see `read_sentences`)
+    :return: the sentences of each block in the same form as `read_sentences` yields them
+    """
+    rest = ''
+    comments = []  # The comments which belong to the first sentence of the next block
+    while True:
+        data = stream.read(block_size)
+        if len(data) == 0:
+            break
+        # Only the newly read part can contain the first sentence boundary after the rest
+        cut = data.rfind('\n\n')
+        if cut == -1:
+            if rest.endswith('\n') and data.startswith('\n'):
+                cut = -1
+            else:
+                rest += data
+                continue
+        block, rest = rest + data[:cut + 2], data[cut + 2:]
+        sentences, comments = split_block(block, conllu_comments, comments)
+        yield sentences
+
+    if len(rest) > 0:
+        yield split_block(rest, conllu_comments, comments)[0]
+
+
+def split_block(block: str, conllu_comments: bool = False, comments: List[str] = None) \
+        -> Tuple[List[Tuple[List[str], List[List[str]]]], List[str]]:
+    """
+    Splits a block of lines into sentences with the same rules as `read_sentences`, for reading a stream in blocks
+    :param block: the lines of the block
+    :param conllu_comments: whether there are comments (as in the CoNLL-U format)
+    :param comments: the comments at the end of the previous block, which belong to the first sentence of this one
+    :return: the sentences of the block and the comments at its end without a sentence after them
+    """
+    if comments is None:
+        comments = []
+    sentences, sentence = [], []
+    for line in block.split('\n'):
+        if len(line) == 0:
+            if len(sentence) > 0:
+                sentences.append((comments, sentence))
+                comments, sentence = [], []
+        elif conllu_comments and len(sentence) == 0 and line.startswith('# '):
+            comments.append(line)
+        else:
+            sentence.append(line.split('\t'))
+    if len(sentence) > 0:
+        sentences.append((comments, sentence))
+        comments = []
+    return sentences, comments
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, vim: expandtab:ts=4 -*-
+
+"""
+Array-encoded transcription engine for bulk jobs (needs NumPy).
+
+The words of a batch are preprocessed by the regular expressions, joined and encoded into one integer array (one code
+per phone of the inner alphabet). The rules of the passes are fixed-width patterns (optionally with a boundary marker
+or space between the segments), so their matches are found with table lookups over shifted views of the array and
+they are applied with vectorised assignments and deletions, without per-word Python work. The results are identical
+to the ones of `Transcriber`.
+"""
+
+from typing import List
+
+from emphon.transcriber import Transcriber, _BATCH_SEPARATOR, _NASALISATION_PAIRS, _PALATAL_FULL_DICT, \
+    _SIBILANT_DICT, _VOICE_PAIRS
+
+try:
+    import numpy as np
+except ImportError:  # Optional dependency, only needed by this engine
+    np = None
+
+_DELETE = 'delete'
+_SEP = '|~§#'
+_SEP_SPACE = '|~§# '
+_CONSONANTS = 'bcdfghjklmnpqrstvxzčďǧɲʃťž'  # Of the doubled letters
+_SHORT = 'bcdfghjklmnpqrstvwxzčďǧɲʃťž'
+_LONG = 'BCDFGHJKLMNPQRSTVWXZČĎǦƝƩŤŽ'
+_OBSTRUENTS = 'bcdfghkpqstvwxzčďǧʃťž'
+_NASALS = 'mnɲ'
+
+
+def _el(chars: str, action=None, optional: bool = False) -> tuple:
+    # One segment of a pattern: its characters (or the index of an earlier segment it repeats) and its replacement:
+    # None keeps it, _DELETE deletes it, (segment index or None for itself, mapping) maps the given segment
+    return chars, optional, action
+
+
+def _to(mapping, source: int = None) -> tuple:
+    return source, mapping
+
+
+def _long_letters_rule() -> list:
+    return [[_el(_CONSONANTS, _to('upper')), _el(0, _DELETE)]]
+
+
+def _double_letters_rule(double_letter_vocab: dict) -> list:
+    return [[_el(digraph[0], _to({digraph[0]: value}))] + [_el(letter, _DELETE) for letter in digraph[1:]]
+            for digraph, value in double_letter_vocab.items()]
+
+
+def _pass_rules(double_letter_vocab: dict, optional_palatal_assimilation: bool) -> list:
+    # The rules of `Transcriber` in the same order, each is a list of patterns where the rules of a method are
+    # separate steps, the alternatives of one pattern are tried in order as in a regular expression
+    long_letters = _long_letters_rule()
+    double_letters = [_double_letters_rule(double_letter_vocab), long_letters]
+    palatal = [[[_el('ǧdlnɲtť', _to(_PALATAL_FULL_DICT)), _el(_SEP, _DELETE, True), _el('j', _DELETE)]],
+               [[_el('dt', _DELETE), _el(_SEP_SPACE, _DELETE, True), _el('ǧť', _to('upper'))]]]
+    if optional_palatal_assimilation:
+        palatal.append([[_el('dt', _to({'d': 'ǧ', 't': 'ť'})), _el(_SEP_SPACE, _DELETE, True), _el('ɲ')]])
+    sibilant_first = _to(_SIBILANT_DICT, 2)
+    return [
+        # n_nasalization
+        [[[_el('n', _to({'n': 'ŋ'})), _el(_SEP, _DELETE, True), _el('gk')]]] + double_letters,
+        # l_assimilation
+        [[[_el('lL', _to({'l': 'R', 'L': 'R'})), _el(_SEP, _DELETE, True), _el('r', _DELETE)]]] + double_letters,
+        # degemination
+        [[[_el(_LONG, _to('lower')), _el(_SEP_SPACE, None, True), _el(_SHORT)]],
+         [[_el(_SHORT), _el(_SHORT), _el(_SEP_SPACE, _DELETE, True), _el(1, _DELETE)]],
+         [[_el(_SHORT), _el(_SEP, _DELETE, True), _el(_LONG, _to('lower'))]],
+         [[_el(_SHORT, _DELETE), _el(_SEP_SPACE, _DELETE, True), _el(0), _el(_OBSTRUENTS)]],
+         [[_el(_LONG, _to('lower')), _el(_OBSTRUENTS)]],
+         [[_el(_SHORT, _DELETE), _el(_SEP_SPACE, _DELETE, True), _el(0), _el(_NASALS)]],
+         [[_el(_LONG, _to('lower')), _el(_NASALS)]],
+         long_letters],
+        # n_assimilation
+        [[[_el('n', _DELETE), _el('|~§', _DELETE, True), _el('lr', _to('upper'))]], long_letters],
+        # palatal_assimilation
+        palatal + [long_letters],
+        # m_nasalization
+        [[[_el('mn', _to({'m': 'ɱ', 'n': 'ɱ'})), _el(_SEP_SPACE, _DELETE, True), _el('fv')]], long_letters],
+        # sibilant_assimilation
+        [[[_el('t', sibilant_first), _el(_SEP, _DELETE, True), _el('ʃs', _DELETE)],
+          [_el('t', sibilant_first), _el(_SEP_SPACE, _DELETE, True), _el('cč', _DELETE)],
+          [_el('d', sibilant_first), _el(_SEP, _DELETE, True), _el('ʃs', _DELETE)]], long_letters],
+        # voice_assimilation
+        [[[_el('bdǧgzžďvĵ', _to(_VOICE_PAIRS)), _el(_SEP, None, True), _el('ptťkʃscfhč')]],
+         [[_el('ptťkʃscfhč', _to(_VOICE_PAIRS)), _el(_SEP, None, True), _el('bdǧgzžďĵ')]],
+         long_letters],
+        # nasalisation
+        [[[_el('n', _to(_NASALISATION_PAIRS, 2)), _el(_SEP, None, True), _el('pbfvǧť')]],
+         [[_el('n', _to({'n': 'Ɲ'})), _el(_SEP, _DELETE, True), _el('ɲ', _DELETE)]],
+         long_letters],
+    ]
+
+
+def _paths(alternatives: list) -> List[list]:
+    # A regular expression tries the optional segment first, then without it, then the next alternative
+    paths = []
+    for segments in alternatives:
+        optional = [i for i, (_, is_optional, _) in enumerate(segments) if is_optional]
+        if not optional:
+            paths.append(segments)
+            continue
+        o = optional[0]
+        paths.append(segments)
+
+        def shift(i):
+            return i - 1 if isinstance(i, int) and i > o else i
+
+        without = []
+        for i, (chars, _, action) in enumerate(segments):
+            if i == o:
+                continue
+            if isinstance(action, tuple):
+                action = (shift(action[0]), action[1])
+            without.append((shift(chars) if isinstance(chars, int) else chars, False, action))
+        paths.append(without)
+    return paths
+
+
+class _CompiledRule:
+    """
+    A pattern compiled to lookup tables over the codes of the alphabet: the conditions and the replacement of each
+    segment of each path (alternative), and the characters which can start a match
+    """
+    def __init__(self, alternatives: list, encoder: '_Alphabet'):
+        self.paths = []
+        first, later = set(), set()
+        for path in _paths(alternatives):
+            conditions, actions = [], []
+            for k, (chars, _, action) in enumerate(path):
+                if isinstance(chars, int):  # Repeats an earlier segment
+                    conditions.append((k, None, chars))
+                    chars = path[chars][0]
+                else:
+                    conditions.append((k, encoder.member_table(chars), None))
+                (first if k == 0 else later).update(chars)
+                if action == _DELETE:
+                    actions.append((k, None, None))
+                elif action is not None:
+                    source, mapping = action
+                    actions.append((k, k if source is None else source, encoder.map_table(mapping)))
+            self.paths.append((len(path), conditions, actions))
+        self.first = encoder.member_table(''.join(first))
+        # The candidates are filtered by the second segment too: a repeated segment or a character class
+        seconds = [conditions[1] for _, conditions, _ in self.paths if len(conditions) > 1]
+        self.repeated_second = len(seconds) == len(self.paths) and all(repeated == 0 for _, _, repeated in seconds)
+        self.second = None
+        if len(seconds) == len(self.paths) and all(table is not None for _, table, _ in seconds):
+            self.second = np.logical_or.reduce([table for _, table, _ in seconds])
+        self.width = max(length for length, _, _ in self.paths)
+        # When no character can both start and continue a match, the matches cannot overlap and all of them are kept
+        self.can_overlap = not first.isdisjoint(later)
+
+    def apply(self, codes, keys, n: int):
+        """
+        :param codes: the codes of the string, padded with separators to be longer than any match
+        :param keys: the codes clipped to the alphabet (the other characters share one code) for the lookups
+        :param n: the length of the string without the padding
+        :return: the new codes (padded) and keys, or None if nothing matched (the arrays are changed in place)
+        """
+        candidates = self.first[keys[:n]]
+        if self.repeated_second:
+            candidates &= codes[:n] == codes[1:n + 1]
+        elif self.second is not None:
+            candidates &= self.second[keys[1:n + 1]]
+        starts = np.flatnonzero(candidates)
+        if len(starts) == 0:
+            return None
+
+        path_of = np.full(len(starts), -1, dtype=np.int8)
+        for i, (_, conditions, _) in enumerate(self.paths):
+            matched = path_of < 0
+            for k, table, repeated in conditions:
+                if table is None:
+                    matched &= codes[starts + k] == codes[starts + repeated]
+                else:
+                    matched &= table[keys[starts + k]]
+            path_of[matched] = i
+        found = path_of >= 0
+        starts, path_of = starts[found], path_of[found]
+        if len(starts) == 0:
+            return None
+
+        if self.can_overlap:
+            # Leftmost non-overlapping matches, as the regular expressions find them
+            lengths = np.array([length for length, _, _ in self.paths])[path_of]
+            keep = np.zeros(len(starts), dtype=bool)
+            end = 0
+            for j, (start, length) in enumerate(zip(starts.tolist(), lengths.tolist())):
+                if start >= end:
+                    keep[j] = True
+                    end = start + length
+            starts, path_of = starts[keep], path_of[keep]
+
+        # The codes are changed in place (the conditions and the sources are read before, from the keys), the keys
+        # follow them
+        deleted = None
+        for i, (_, _, actions) in enumerate(self.paths):
+            path_starts = starts[path_of == i]
+            if len(path_starts) == 0:
+                continue
+            for k, source, table in actions:
+                if source is None:
+                    if deleted is None:
+                        deleted = np.zeros(len(codes), dtype=bool)
+                    deleted[path_starts + k] = True
+                else:
+                    codes[path_starts + k] = table[keys[path_starts + source]]
+        for i, (_, _, actions) in enumerate(self.paths):
+            for k, source, _ in actions:
+                if source is not None:
+                    positions = starts[path_of == i] + k
+                    keys[positions] = np.minimum(codes[positions], len(self.first) - 1)
+        if deleted is None:
+            return codes, keys
+        kept = ~deleted
+        return codes[kept], keys[kept]
+
+
+class _Alphabet:
+    """
+    Maps the characters to integer codes: the inner alphabet has fixed codes, the other characters of a batch get
+    codes after them and are not in any character class
+    """
+    def __init__(self, characters: set):
+        self.characters = sorted(characters)
+        self.codes = {character: i for i, character in enumerate(self.characters)}
+        self.other = len(self.characters)
+        self.code_points = np.array([ord(character) for character in self.characters], dtype=np.uint32)
+
+    def member_table(self, chars: str):
+        table = np.zeros(self.other + 1, dtype=bool)
+        table[[self.codes[character] for character in chars]] = True
+        return table
+
+    def map_table(self, mapping):
+        table = np.arange(self.other + 1, dtype=np.uint16)
+        for character, i in self.codes.items():
+            if mapping == 'upper':
+                target = character.upper()
+            elif mapping == 'lower':
+                target = character.lower()
+            else:
+                target = mapping.get(character, character)
+            if target in self.codes:
+                table[i] = self.codes[target]
+        return table
+
+    def encode(self, text: str):
+        """
+        :return: the codes of the text and the code points of the codes beyond the alphabet
+        """
+        code_points = np.frombuffer(text.encode('UTF-32-LE'), dtype='<u4')
+        unique, inverse = np.unique(code_points, return_inverse=True)
+        extra = []
+        unique_codes = np.empty(len(unique), dtype=np.uint16 if len(unique) + self.other < 1 << 16 else np.int32)
+        for i, code_point in enumerate(unique.tolist()):
+            code = self.codes.get(chr(code_point))
+            if code is None:
+                code = self.other + len(extra)
+                extra.append(code_point)
+            unique_codes[i] = code
+        return unique_codes[inverse.reshape(-1)], np.array(extra, dtype=np.uint32)
+
+    def decode(self, codes, extra) -> str:
+        return np.concatenate((self.code_points, extra))[codes].astype('<u4').tobytes().decode('UTF-32-LE')
+
+
+class VectorTranscriber:
+    """
+    Transcribes batches of words with the rules applied on an integer array of the whole batch (see the module
+    documentation). It pays off for large batches of distinct words, e.g. in bulk offline jobs.
+    """
+    def __init__(self, ipaize: bool = True, optional_palatal_assimilation: bool = False):
+        """
+        :param ipaize: whether the output uses the inner representation or the IPA form
+        :param optional_palatal_assimilation: optional palatal assimilation in cases like `lapátnyél`
+        """
+        if np is None:
+            raise ImportError('The vectorised engine needs NumPy, install it with `pip install emphon[numpy]`!')
+
+        self.ipaize = ipaize
+        self.optional_palatal_assimilation = optional_palatal_assimilation
+        # Preprocessing and the words which cannot be batched are left to the regular expressions
+        self._transcriber = Transcriber(ipaize=ipaize, optional_palatal_assimilation=optional_palatal_assimilation,
+                                        cache=False)
+
+        rules = _pass_rules(self._transcriber.double_letter_vocab, optional_palatal_assimilation)
+        boundaries = [[[_el(_SEP, _DELETE)]], _long_letters_rule()]
+        characters = {_BATCH_SEPARATOR, ' '} | set(self._transcriber.ipa_key)
+        for steps in rules + [boundaries]:
+            for alternatives in steps:
+                for segments in alternatives:
+                    for chars, _, action in segments:
+                        if isinstance(chars, str):
+                            characters.update(chars)
+                            characters.update(character.upper() for character in chars)
+                            characters.update(character.lower() for character in chars)
+                        if isinstance(action, tuple) and isinstance(action[1], dict):
+                            characters.update(action[1].values())
+        characters = {character for character in characters if len(character) == 1}
+        self._alphabet = _Alphabet(characters)
+        # Each rule method ends with the doubled letters, which are only looked for when the method changed something
+        # (the strings between the methods never contain doubled letters)
+        self._methods = [[_CompiledRule(alternatives, self._alphabet) for alternatives in steps] for steps in rules]
+        self._boundaries = [_CompiledRule(alternatives, self._alphabet) for alternatives in boundaries]
+        self._padding = max(rule.width for steps in self._methods + [self._boundaries] for rule in steps)
+        self._separator = self._alphabet.codes[_BATCH_SEPARATOR]
+
+    def transcribe_batch(self, words: List[str], passes=2) -> List[str]:
+        """
+        :param words: the words to process
+        :param passes: the number of passes the words go under
+        :return: the processed words in the order of the input, identical to the results of `Transcriber`
+        """
+        # `ch$` could not match at the end of a word inside the batch, these words are processed one by one
+        batch = [word for word in set(words) if _BATCH_SEPARATOR not in word and not word.rstrip('\n').endswith('ch')]
+        results = {}
+        if batch:
+            for word, result in zip(batch, self._transcribe_joined(_BATCH_SEPARATOR.join(batch), passes).split(
+                    _BATCH_SEPARATOR)):
+                results[word] = result
+        return [results[word] if word in results else self._transcriber.transcribe(word, passes) for word in words]
+
+    def _transcribe_joined(self, sentence: str, passes: int) -> str:
+        transcriber = self._transcriber
+        sentence = transcriber.hiatus_filling(transcriber.h_transformation(transcriber.double_letters(
+            transcriber.x_letter(sentence))))
+
+        codes, extra = self._alphabet.encode(sentence)
+        # The padding makes room for the segments of the matches at the end, it is never part of a match
+        codes = np.concatenate((codes, np.full(self._padding, self._separator, dtype=codes.dtype)))
+        keys = np.minimum(codes, self._alphabet.other)
+
+        methods = [steps for _ in range(passes) for steps in self._methods]
+        if self.ipaize:
+            methods.append(self._boundaries)
+        for steps in methods:
+            changed = False
+            for rule in steps[:-1]:
+                result = rule.apply(codes, keys, len(codes) - self._padding)
+                if result is not None:
+                    (codes, keys), changed = result, True
+            if changed:
+                result = steps[-1].apply(codes, keys, len(codes) - self._padding)
+                if result is not None:
+                    codes, keys = result
+
+        sentence = self._alphabet.decode(codes[:len(codes) - self._padding], extra)
+        if self.ipaize:
+            return sentence.translate(transcriber._ipa_table)
+        return sentence
@@ -36,10 +36,18 @@ setuptools.setup(
     python_requires='>=3.6',
     install_requires=['xtsv>=1.0.0,<2.0.0',
                       ],
+    extras_require={'numpy': ['numpy'],
+                    },
     include_package_data=True,
     entry_points={
         'console_scripts': [
             'emphon=emphon.__main__:main',
+            'emphon-stream=emphon.stream:main',
+            'emphon-lexicon=emphon.lexicon:main',
+            'emphon-equivalence=emphon.equivalence:main',
+            'emphon-shard=emphon.shard:main',
+            'emphon-service=emphon.service:main',
+            'emphon-bundle=emphon.bundle_builder:main',
         ]
     },
 )
@@ -0,0 +1,22 @@
+import pytest
+
+from emphon.argparser import parser_skeleton
+from emphon.stream import add_emphon_args
+
+
+@pytest.mark.parametrize('option', ['--cache-size', '--sentence-cache-size'])
+@pytest.mark.parametrize('value', ['0', '-1', 'many'])
+def test_invalid_sizes_are_usage_errors(option, value, capsys):
+    argparser = parser_skeleton()
+    add_emphon_args(argparser)
+    with pytest.raises(SystemExit) as exit_info:
+        argparser.parse_args([option, value])
+    assert exit_info.value.code == 2
+    assert 'is not a positive integer' in capsys.readouterr().err
+
+
+def test_valid_sizes():
+    argparser = parser_skeleton()
+    add_emphon_args(argparser)
+    opts = argparser.parse_args(['--cache-size', '10', '--sentence-cache-size', '1'])
+    assert (opts.cache_size, opts.sentence_cache_size) == (10, 1)
@@ -0,0 +1,62 @@
+import os
+import sys
+import json
+import marshal
+import subprocess
+
+import pytest
+
+from emphon.bundle import SUPPORTED
+from emphon.bundle_builder import build_bundle
+
+# The bundle is loaded when the transcriber is imported, so each check runs in a new process
+_CHECK = """
+import json
+from emphon.bundle import bundle_stats
+from emphon.transcriber import Transcriber
+print(json.dumps([Transcriber().transcribe('Budapest lássuk egyetlenegy'), bundle_stats()]))
+"""
+
+
+def run_with_bundle(path):
+    env = dict(os.environ, EMPHON_BUNDLE=path,
+               PYTHONPATH=os.pathsep.join(filter(None, (os.getcwd(), os.environ.get('PYTHONPATH')))))
+    output = subprocess.run([sys.executable, '-c', _CHECK], env=env, check=True, capture_output=True).stdout
+    return json.loads(output.decode('UTF-8'))
+
+
+@pytest.fixture(scope='module')
+def expected_phon():
+    return run_with_bundle('')[0]  # Without a bundle
+
+
+@pytest.mark.skipif(not SUPPORTED, reason='the bundle is not supported by this Python interpreter')
+def test_bundle_is_loaded(tmp_path, expected_phon):
+    path = str(tmp_path / 'rules.bundle')
+    count = build_bundle(path)
+    phon, stats = run_with_bundle(path)
+    assert phon == expected_phon
+    assert stats['path'] == path and stats['loaded'] == count and stats['compiled'] == 0
+
+
+@pytest.mark.skipif(not SUPPORTED, reason='the bundle is not supported by this Python interpreter')
+def test_foreign_bundle_is_ignored(tmp_path, expected_phon):
+    path = str(tmp_path / 'rules.bundle')
+    build_bundle(path)
+    with open(path, 'rb') as infile:
+        bundle_format, interpreter_tag, patterns, ipa_key = marshal.load(infile)
+    foreign_tag = ('cpython', 'cpython-29', '2.9.0 (foreign)') + interpreter_tag[3:]
+    with open(path, 'wb') as outfile:
+        marshal.dump((bundle_format, foreign_tag, patterns, ipa_key), outfile)
+
+    phon, stats = run_with_bundle(path)
+    assert phon == expected_phon
+    assert stats['path'] is None and stats['loaded'] == 0 and stats['compiled'] > 0
+
+
+def test_broken_bundle_is_ignored(tmp_path, expected_phon):
+    path = tmp_path / 'rules.bundle'
+    path.write_bytes(b'not a bundle')
+    phon, stats = run_with_bundle(str(path))
+    assert phon == expected_phon
+    assert stats['path'] is None and stats['loaded'] == 0 and stats['compiled'] > 0
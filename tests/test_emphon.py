@@ -0,0 +1,47 @@
+import os
+
+from emphon import EmPhon
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_INPUT = os.path.join(TESTS_DIR, 'inputs', 'telex_morph.in')
+FIELD_NAMES = {'form': 0, 'anas': 1}
+
+
+def read_test_sentences(path=TEST_INPUT):
+    from emphon.tsv import read_header, read_sentences
+
+    with open(path, encoding='UTF-8') as infile:
+        header, field_names = read_header(infile, {'form', 'anas'})
+        return header, field_names, [sentence for _, sentence in read_sentences(infile)]
+
+
+def new_emphon(**kwargs):
+    return EmPhon({'form', 'anas'}, ['phon'], include_sentence=True, **kwargs)
+
+
+def test_sentence_cache_repeats_within_chunk():
+    _, field_names, sentences = read_test_sentences()
+    emphon = new_emphon(sentence_cache=True)
+    field_names = emphon.prepare_fields(field_names)
+    chunk = [[list(token) for token in sentences[0]] for _ in range(200)]
+    expected = new_emphon().process_sentence([list(token) for token in sentences[0]], field_names)
+
+    output = emphon.process_sentences(chunk, field_names)
+
+    assert all(sentence == expected for sentence in output)
+    info = emphon.sentence_cache_info()
+    assert (info.hits, info.misses, info.currsize) == (199, 1, 1)
+
+
+def test_sentence_cache_mixed_chunk():
+    _, field_names, sentences = read_test_sentences()
+    emphon = new_emphon(sentence_cache=True)
+    field_names = emphon.prepare_fields(field_names)
+    order = [0, 1, 0, 2, 1, 0]
+    expected = [new_emphon().process_sentence([list(token) for token in sentences[i]], field_names) for i in order]
+
+    output = emphon.process_sentences([[list(token) for token in sentences[i]] for i in order], field_names)
+
+    assert output == expected
+    info = emphon.sentence_cache_info()
+    assert (info.hits, info.misses) == (3, 3)
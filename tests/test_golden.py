@@ -0,0 +1,152 @@
+import os
+import sys
+import json
+import threading
+import subprocess
+import urllib.request
+import importlib.util
+
+import pytest
+
+from emphon.argparser import parser_skeleton
+from emphon.service import MicroBatcher, ServiceServer
+from emphon.stream import add_emphon_args, emphon_kwargs_from_opts
+from emphon.tsv import read_header, read_sentences
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+INPUTS = sorted(name[:-3] for name in os.listdir(os.path.join(TESTS_DIR, 'inputs')) if name.endswith('.in'))
+READERS = {'xtsv': [], 'stream_reader': ['--stream-reader']}
+# The options which must not change the output, each one is run on every input with both readers
+MODES = {
+    'sentence_cache': ['--sentence-cache'],
+    'streaming': ['--streaming'],
+    'vectorized': ['--vectorized'],
+    'no_cache': ['--no-cache'],
+    'outputs_ipa': ['--outputs', 'ipa'],
+}
+
+
+def input_path(name):
+    return os.path.join(TESTS_DIR, 'inputs', name + '.in')
+
+
+def read_golden(name):
+    with open(os.path.join(TESTS_DIR, 'outputs', name + '.out'), encoding='UTF-8') as infile:
+        return infile.read()
+
+
+def read_params(name):
+    # The extra parameters of an input (e.g. --conllu-comments) are in the .params file next to it
+    path = os.path.join(TESTS_DIR, 'inputs', name + '.params')
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='UTF-8') as infile:
+        return infile.read().split()
+
+
+def read_file_sentences(path, conllu_comments):
+    with open(path, encoding='UTF-8') as infile:
+        _, field_names = read_header(infile, {'form', 'anas'})
+        return field_names, list(read_sentences(infile, conllu_comments))
+
+
+def run_module(module, *args):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (ROOT_DIR, os.environ.get('PYTHONPATH')))))
+    return subprocess.run([sys.executable, '-m', module, *args], env=env, check=True, capture_output=True,
+                          cwd=TESTS_DIR).stdout.decode('UTF-8')
+
+
+def drop_field(output, field):
+    # Removes a target field (its column and its sentence comment) from the output
+    lines = output.split('\n')
+    column = lines[0].split('\t').index(field)
+    kept = []
+    for line in lines:
+        if line.startswith('# {0} = '.format(field)):
+            continue
+        if line and not line.startswith('# '):
+            line = '\t'.join(value for i, value in enumerate(line.split('\t')) if i != column)
+        kept.append(line)
+    return '\n'.join(kept)
+
+
+@pytest.mark.parametrize('reader', sorted(READERS))
+@pytest.mark.parametrize('mode', sorted(MODES))
+@pytest.mark.parametrize('name', INPUTS)
+def test_modes(name, mode, reader):
+    if mode == 'vectorized' and importlib.util.find_spec('numpy') is None:
+        pytest.skip('--vectorized needs NumPy')
+    output = run_module('emphon', *READERS[reader], *MODES[mode], *read_params(name), '-i', input_path(name))
+    assert output == read_golden(name)
+
+
+@pytest.mark.parametrize('name', INPUTS)
+def test_workers(name):
+    output = run_module('emphon', '--workers', '2', '--chunk-size', '2', *read_params(name), '-i', input_path(name))
+    assert output == read_golden(name)
+
+
+@pytest.mark.parametrize('name', INPUTS)
+def test_outputs_inner_ipa(name):
+    output = run_module('emphon', '--stream-reader', '--outputs', 'inner', 'ipa', *read_params(name),
+                        '-i', input_path(name))
+    assert drop_field(output, 'phon_inner') == read_golden(name)
+    inner = run_module('emphon', '--stream-reader', '--no-ipaize', *read_params(name), '-i', input_path(name))
+    assert drop_field(output, 'phon') == inner.replace('\tphon\n', '\tphon_inner\n', 1).replace('# phon = ',
+                                                                                               '# phon_inner = ')
+
+
+@pytest.mark.parametrize('reader', sorted(READERS))
+@pytest.mark.parametrize('name', INPUTS)
+def test_lexicon(name, reader, tmp_path):
+    lexicon = str(tmp_path / 'lexicon.bin')
+    run_module('emphon.lexicon', *read_params(name), '-i', input_path(name), '-o', lexicon)
+    output = run_module('emphon', *READERS[reader], '--lexicon', lexicon, *read_params(name), '-i', input_path(name))
+    assert output == read_golden(name)
+
+
+@pytest.mark.parametrize('name', INPUTS)
+def test_shards(name, tmp_path):
+    index = str(tmp_path / 'input.idx')
+    run_module('emphon.shard', 'index', '-i', input_path(name), '--index', index)
+    shard_outputs = []
+    for shard in range(1, 4):
+        shard_output = str(tmp_path / 'shard{0}.out'.format(shard))
+        run_module('emphon.shard', 'run', '-i', input_path(name), '--index', index, '--shard', '{0}/3'.format(shard),
+                   '--checkpoint-every', '1', '-o', shard_output, *read_params(name))
+        shard_outputs.append(shard_output)
+    output = str(tmp_path / 'merged.out')
+    run_module('emphon.shard', 'merge', '-o', output, *shard_outputs)
+    with open(output, encoding='UTF-8') as infile:
+        assert infile.read() == read_golden(name)
+
+
+@pytest.mark.parametrize('name', INPUTS)
+def test_service(name):
+    argparser = parser_skeleton()
+    add_emphon_args(argparser)
+    params = read_params(name)
+    emphon_kwargs = emphon_kwargs_from_opts(argparser, argparser.parse_args(params))
+    field_names, sentences = read_file_sentences(input_path(name), '--conllu-comments' in params)
+    _, golden = read_file_sentences(os.path.join(TESTS_DIR, 'outputs', name + '.out'), True)  # With the added comments
+    request = {'sentences': [[{'form': token[field_names['form']], 'anas': token[field_names['anas']]}
+                              for token in tokens] for _, tokens in sentences]}
+
+    batcher = MicroBatcher(emphon_kwargs, workers=0)
+    server = ServiceServer(('127.0.0.1', 0), batcher)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(
+                'http://127.0.0.1:{0}/transcribe'.format(server.server_address[1]),
+                json.dumps(request).encode('UTF-8'), {'Content-Type': 'application/json'}), timeout=30) as response:
+            results = json.loads(response.read().decode('UTF-8'))['sentences']
+    finally:
+        server.shutdown()
+        server.server_close()
+        batcher.close()
+
+    assert len(results) == len(golden)
+    for result, (comments, tokens) in zip(results, golden):
+        assert result['comments'] == [comment for comment in comments if comment.startswith('# phon = ')]
+        assert [token['phon'] for token in result['tokens']] == [token[-1] for token in tokens]
@@ -0,0 +1,32 @@
+import json
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from emphon.service import MicroBatcher, ServiceServer
+
+
+def test_concurrent_requests():
+    batcher = MicroBatcher({'source_fields': {'form', 'anas'}, 'target_fields': ['phon']}, workers=0)
+    server = ServiceServer(('127.0.0.1', 0), batcher)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:{0}/transcribe'.format(server.server_address[1])
+    clients = 100  # Far more than the default backlog of socketserver
+
+    def post(i):
+        request = urllib.request.Request(url, json.dumps({'words': ['alma', 'Budapest', str(i)]}).encode('UTF-8'),
+                                         {'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, json.loads(response.read().decode('UTF-8'))
+
+    try:
+        with ThreadPoolExecutor(clients) as executor:
+            results = list(executor.map(post, range(3 * clients)))
+    finally:
+        server.shutdown()
+        server.server_close()
+        batcher.close()
+
+    assert all(status == 200 for status, _ in results)
+    assert all(body['words'][:2] == [{'phon': 'ɒlmɒ'}, {'phon': 'budɒpɛʃt'}] for _, body in results)
+    assert batcher.stats()['requests'] == 3 * clients